@@ -0,0 +1,184 @@
+"""
+Servidores locales que imitan wa.cambiocuba.money y la Bot API de Telegram
+
+No importan nada de `src`, así se pueden levantar antes de configurar el
+entorno del bot con sus URLs.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import time
+from collections import Counter
+from io import BytesIO
+from itertools import count
+from typing import Dict, List, Optional
+from aiohttp import web
+from PIL import Image, ImageDraw
+
+
+def render_rates_image(title: str, version: int) -> bytes:
+    """Generar una tabla de tasas en PNG cuyos números dependen de `version`"""
+    image = Image.new('RGB', (480, 320), 'white')
+    draw = ImageDraw.Draw(image)
+    draw.text((20, 15), title, fill='black')
+    for row, currency in enumerate(('USD', 'EUR', 'MLC', 'USDT')):
+        value = 300 + version * 5 + row * 20
+        draw.text((20, 60 + row * 50), f"1 {currency}", fill='black')
+        draw.text((300, 60 + row * 50), f"{value}.00 CUP", fill='black')
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class _Server:
+    """Servidor aiohttp en un puerto libre de 127.0.0.1"""
+    
+    def __init__(self):
+        self.web_app = web.Application(client_max_size=50 * 1024 * 1024)
+        self._runner: Optional[web.AppRunner] = None
+        self.port = 0
+    
+    async def start(self):
+        self._runner = web.AppRunner(self.web_app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+    
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+    
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+
+class FakeRateServer(_Server):
+    """
+    Sirve /real_crypto_trmi.png y /trmi.png con ETag y respuestas 304
+    
+    `publish()` cambia los números de ambas imágenes. `latency` agrega una
+    demora (segundos) a cada respuesta.
+    """
+    
+    PATHS = {'/real_crypto_trmi.png': 'TRMCC', '/trmi.png': 'TRMI'}
+    
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.requests: Counter = Counter()
+        self._images: Dict[str, bytes] = {}
+        self.version = 0
+        self.publish()
+        for path in self.PATHS:
+            self.web_app.router.add_route('*', path, self._handle)
+    
+    def publish(self):
+        """Publicar tasas nuevas"""
+        self.version += 1
+        for path, title in self.PATHS.items():
+            self._images[path] = render_rates_image(title, self.version)
+    
+    def _etag(self, path: str) -> str:
+        return '"' + hashlib.md5(self._images[path]).hexdigest() + '"'
+    
+    async def _handle(self, request: web.Request) -> web.Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        path = request.path
+        etag = self._etag(path)
+        headers = {'ETag': etag, 'Content-Type': 'image/png'}
+        
+        if request.headers.get('If-None-Match') == etag:
+            self.requests['not_modified'] += 1
+            return web.Response(status=304, headers={'ETag': etag})
+        if request.method == 'HEAD':
+            self.requests['head'] += 1
+            return web.Response(headers={**headers, 'Content-Length': str(len(self._images[path]))})
+        
+        self.requests['get'] += 1
+        return web.Response(body=self._images[path], headers=headers)
+
+
+class FakeTelegramAPI(_Server):
+    """
+    Responde a los métodos de la Bot API que usa el bot
+    
+    Registra cada llamada con su chat, cuántas fotos se subieron como archivo
+    (frente a reutilizar un file_id) y, con `flood_rate`, responde 429 a esa
+    fracción de los envíos para ejercitar los reintentos.
+    """
+    
+    def __init__(self, latency: float = 0.0, flood_rate: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.calls: Counter = Counter()
+        self.uploads = 0
+        self.flood_responses = 0
+        # chat -> momentos (monotonic) de cada respuesta enviada
+        self.deliveries: Dict[int, List[float]] = {}
+        self._message_ids = count(1)
+        self._file_ids = count(1)
+        self.web_app.router.add_post('/bot{token}/{method}', self._handle)
+    
+    async def _params(self, request: web.Request) -> Dict[str, object]:
+        if request.content_type == 'application/json':
+            return await request.json()
+        form = await request.post()
+        self.uploads += sum(1 for value in form.values() if hasattr(value, 'file'))
+        return dict(form)
+    
+    def _message(self, chat_id: int, **extra) -> Dict[str, object]:
+        return {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            **extra,
+        }
+    
+    def _photo(self) -> List[Dict[str, object]]:
+        file_id = f"fake-file-{next(self._file_ids)}"
+        return [{'file_id': file_id, 'file_unique_id': file_id, 'width': 480, 'height': 320}]
+    
+    async def _handle(self, request: web.Request) -> web.Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        method = request.match_info['method']
+        params = await self._params(request)
+        self.calls[method] += 1
+        chat_id = int(params.get('chat_id', 0) or 0)
+        
+        if method.startswith('send') and self.flood_rate and random.random() < self.flood_rate:
+            self.flood_responses += 1
+            return web.json_response({
+                'ok': False, 'error_code': 429,
+                'description': 'Too Many Requests: retry after 1',
+                'parameters': {'retry_after': 1},
+            })
+        
+        if method == 'getMe':
+            result: object = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        elif method == 'sendMessage':
+            result = self._message(chat_id, text=params.get('text', ''))
+        elif method == 'sendPhoto':
+            result = self._message(chat_id, photo=self._photo())
+        elif method == 'sendMediaGroup':
+            media = params.get('media')
+            items = json.loads(media) if isinstance(media, str) else media or []
+            result = [self._message(chat_id, photo=self._photo()) for _ in items]
+        elif method == 'getUpdates':
+            # Long polling sin updates: esperar un poco para no girar en vacío
+            await asyncio.sleep(min(float(params.get('timeout', 0) or 0), 1.0))
+            result = []
+        elif method == 'getChatMember':
+            result = {'status': 'administrator', 'user': {'id': 1, 'is_bot': False, 'first_name': 'Admin'}}
+        else:
+            result = True
+        
+        if method.startswith('send'):
+            self.deliveries.setdefault(chat_id, []).append(time.monotonic())
+        return web.json_response({'ok': True, 'result': result})
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Verificación de los leases (locks con vencimiento) de los backends de estado
+
+Recorre con dos dueños los casos de los que depende la elección de líder:
+tomar, rechazar al otro dueño, renovar antes de vencer, ignorar el release
+de quien no tiene el lock, soltar y vencer sin renovación. Con Redis
+ejecuta los scripts Lua reales (_ACQUIRE_SCRIPT y _RELEASE_SCRIPT).
+
+Sin --redis-url usa fakeredis en el mismo proceso (requiere `fakeredis` y
+`lupa` para evaluar Lua); con --redis-url usa ese servidor.
+
+Uso:
+    uv run python -m benchmarks.lease_check --backend local
+    uv run --with fakeredis --with lupa python -m benchmarks.lease_check --backend redis
+    uv run --extra redis python -m benchmarks.lease_check --redis-url redis://localhost:6379/15
+"""
+import argparse
+import asyncio
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+from typing import List, Optional, Tuple
+from src.services.state_backend import LocalStateBackend, RedisStateBackend, StateBackend
+
+LOCK = 'lease-check'
+
+
+async def check_leases(backend: StateBackend, ttl: float) -> List[Tuple[str, bool]]:
+    """
+    Ejecutar los casos sobre un backend ya iniciado
+
+    Args:
+        backend: Backend a verificar
+        ttl: Duración del lease en segundos (corta, la prueba espera varias veces)
+
+    Returns:
+        (descripción, se cumplió) por caso
+    """
+    first, second = f"a-{uuid.uuid4().hex}", f"b-{uuid.uuid4().hex}"
+    results = []
+
+    def expect(description: str, condition: bool):
+        results.append((description, condition))
+
+    expect("el primer dueño toma el lock libre", await backend.acquire_lock(LOCK, first, ttl))
+    expect("otro dueño no puede tomarlo", not await backend.acquire_lock(LOCK, second, ttl))
+
+    # Renovar a mitad del lease lo extiende más allá del vencimiento original
+    await asyncio.sleep(ttl * 0.6)
+    expect("el dueño lo renueva", await backend.acquire_lock(LOCK, first, ttl))
+    await asyncio.sleep(ttl * 0.6)
+    expect("la renovación extiende el lease", not await backend.acquire_lock(LOCK, second, ttl))
+
+    await backend.release_lock(LOCK, second)
+    expect("el release de otro dueño no lo suelta", not await backend.acquire_lock(LOCK, second, ttl))
+
+    await backend.release_lock(LOCK, first)
+    expect("tras soltarlo otro dueño lo toma", await backend.acquire_lock(LOCK, second, ttl))
+
+    # Sin renovar, el lease vence y queda libre
+    await asyncio.sleep(ttl * 1.5)
+    expect("vencido el lease otro dueño lo toma", await backend.acquire_lock(LOCK, first, ttl))
+
+    await backend.release_lock(LOCK, first)
+    return results
+
+
+def create_backend(kind: str, redis_url: Optional[str], directory: Path) -> StateBackend:
+    """Backend sin iniciar para `kind` ('local' o 'redis')"""
+    if kind == 'local':
+        return LocalStateBackend(directory)
+    prefix = f"lease-check:{uuid.uuid4().hex}:"
+    if redis_url:
+        return RedisStateBackend(redis_url, prefix)
+    try:
+        import fakeredis
+    except ImportError:
+        raise SystemExit("Sin --redis-url hace falta fakeredis (y lupa): pip install fakeredis lupa")
+    return RedisStateBackend('fakeredis://', prefix, client=fakeredis.FakeAsyncRedis())
+
+
+async def run(args: argparse.Namespace) -> bool:
+    kinds = ('local', 'redis') if args.backend == 'all' else (args.backend,)
+    passed = True
+    with tempfile.TemporaryDirectory(prefix='lease-check-') as directory:
+        for kind in kinds:
+            backend = create_backend(kind, args.redis_url, Path(directory))
+            await backend.start()
+            try:
+                results = await check_leases(backend, args.ttl)
+            finally:
+                await backend.close()
+            print(f"{type(backend).__name__}:")
+            for description, ok in results:
+                print(f"  {'✅' if ok else '❌'} {description}")
+            passed = passed and all(ok for _, ok in results)
+    return passed
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=('local', 'redis', 'all'), default='all', help='backends a verificar')
+    parser.add_argument('--redis-url', help='servidor Redis real (por defecto fakeredis en proceso)')
+    parser.add_argument('--ttl', type=float, default=0.5, help='duración del lease en la prueba (s)')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    return 0 if asyncio.run(run(parse_args(argv))) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Benchmark de carga del bot contra servidores falsos locales
+
+Levanta un servidor de tasas y una Bot API falsos, arma el bot real
+(CambioBot) apuntando a ellos y mide:
+
+- comandos: miles de usuarios simulados enviando comandos a la vez, primero
+  con la caché vacía y luego con la caché caliente
+- difusión: una publicación nueva detectada por check_for_updates y enviada
+  a todos los suscriptores
+
+Uso:
+    uv run python -m benchmarks.load_test --users 2000 --subscribers 5000
+    uv run python -m benchmarks.load_test --json resultado.json --max-p99-ms 500
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+from benchmarks.fake_servers import FakeRateServer, FakeTelegramAPI
+
+COMMANDS = ('tasas', 'crypto', 'trmi', 'usd', 'help')
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Percentil p (0-100) por el método del rango más cercano"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def configure_environment(args: argparse.Namespace, rates: FakeRateServer, telegram: FakeTelegramAPI, workdir: Path):
+    """Apuntar la configuración del bot a los servidores falsos (antes de importar src)"""
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': '123456:BENCHMARK',
+        'TELEGRAM_BASE_URL': f"{telegram.url}/bot",
+        'TELEGRAM_BASE_FILE_URL': f"{telegram.url}/file/bot",
+        'CRYPTO_URL': f"{rates.url}/real_crypto_trmi.png",
+        'TRMI_URL': f"{rates.url}/trmi.png",
+        'DATA_DIR': str(workdir / 'data'),
+        'STATE_DIR': str(workdir / 'data' / 'state'),
+        'STATE_BACKEND': 'local',
+        'BOT_MODE': 'polling',
+        'METRICS_PORT': '0',
+        'CONCURRENT_UPDATES': str(args.concurrency),
+        'UPDATE_BACKLOG_LIMIT': str(args.backlog_limit),
+        'BROADCAST_GLOBAL_RATE': str(args.broadcast_rate),
+        'BROADCAST_WORKERS': str(args.broadcast_workers),
+    })
+    os.chdir(workdir)
+
+
+def make_update(bot, update_id: int, chat_id: int, command: str):
+    """Update de un mensaje privado con un comando"""
+    from telegram import Update
+    text = f"/{command}"
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': f"user{chat_id}"},
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text)}],
+        },
+    }, bot)
+
+
+async def command_wave(bot_app, users: int, first_chat: int, telegram: FakeTelegramAPI) -> Dict[str, object]:
+    """Enviar un comando por usuario, todos a la vez, a través del procesador de updates"""
+    processor = bot_app.update_processor
+    latencies: List[float] = []
+    
+    async def user(index: int):
+        chat_id = first_chat + index
+        update = make_update(bot_app.bot, chat_id, chat_id, COMMANDS[index % len(COMMANDS)])
+        started = time.perf_counter()
+        await processor.process_update(update, bot_app.process_update(update))
+        if chat_id in telegram.deliveries:
+            latencies.append(time.perf_counter() - started)
+    
+    shed_before = getattr(processor, 'shed', 0)
+    started = time.perf_counter()
+    await asyncio.gather(*(user(index) for index in range(users)))
+    duration = time.perf_counter() - started
+    
+    return {
+        'users': users,
+        'answered': len(latencies),
+        'shed': getattr(processor, 'shed', 0) - shed_before,
+        'duration_s': round(duration, 3),
+        'throughput_per_s': round(len(latencies) / duration, 1) if duration else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'max_ms': round(max(latencies, default=0.0) * 1000, 1),
+    }
+
+
+async def broadcast_round(bot, rates: FakeRateServer, telegram: FakeTelegramAPI) -> Dict[str, object]:
+    """Publicar tasas nuevas y medir la detección y la difusión a los suscriptores"""
+    rates.publish()
+    sends_before = telegram.calls['sendPhoto']
+    uploads_before = telegram.uploads
+    
+    started = time.perf_counter()
+    found = await bot.rates_service.check_for_updates()
+    duration = time.perf_counter() - started
+    
+    result = bot.notifier.last_result
+    return {
+        'detected': found,
+        'subscribers': len(bot.subscribers),
+        'duration_s': round(duration, 3),
+        'sent': result.sent if result else 0,
+        'failed': result.failed if result else 0,
+        'retries': result.retries if result else 0,
+        'p50_ms': round(result.percentile(50) * 1000, 1) if result else 0.0,
+        'p99_ms': round(result.percentile(99) * 1000, 1) if result else 0.0,
+        'send_photo_calls': telegram.calls['sendPhoto'] - sends_before,
+        'uploads': telegram.uploads - uploads_before,
+    }
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, object]:
+    """Ejecutar todas las fases y devolver los resultados"""
+    rates = FakeRateServer(latency=args.upstream_latency)
+    telegram = FakeTelegramAPI(latency=args.telegram_latency, flood_rate=args.flood_rate)
+    await rates.start()
+    await telegram.start()
+    
+    with tempfile.TemporaryDirectory(prefix='cambiobot-bench-') as workdir:
+        configure_environment(args, rates, telegram, Path(workdir))
+        from src.bot.cambio_bot import CambioBot
+        logging.getLogger().setLevel(args.log_level.upper())
+        logging.getLogger('httpx').setLevel(logging.WARNING)
+        
+        started = time.perf_counter()
+        bot = CambioBot()
+        await bot.start_services(seed=())
+        await bot.app.initialize()
+        bot.rates_service.bot_app = bot.app
+        await bot.warmup()
+        startup = time.perf_counter() - started
+        
+        try:
+            results: Dict[str, object] = {'startup_s': round(startup, 3)}
+            
+            upstream_before = sum(rates.requests.values())
+            results['cold'] = await command_wave(bot.app, args.users, 1_000_000, telegram)
+            results['cold']['upstream_requests'] = sum(rates.requests.values()) - upstream_before
+            
+            upstream_before = sum(rates.requests.values())
+            results['warm'] = await command_wave(bot.app, args.users, 2_000_000, telegram)
+            results['warm']['upstream_requests'] = sum(rates.requests.values()) - upstream_before
+            
+            for index in range(args.subscribers):
+                bot.subscribers.add(3_000_000 + index, 'private')
+            await bot.rates_service.check_for_updates()
+            upstream_before = sum(rates.requests.values())
+            results['broadcast'] = await broadcast_round(bot, rates, telegram)
+            results['broadcast']['upstream_requests'] = sum(rates.requests.values()) - upstream_before
+            await asyncio.gather(*bot.rates_service._refresh_tasks, return_exceptions=True)
+            
+            results['upstream'] = dict(rates.requests)
+            results['telegram_calls'] = dict(telegram.calls)
+            results['telegram_uploads'] = telegram.uploads
+            results['max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+            return results
+        finally:
+            await bot.app.shutdown()
+            await bot.stop_services()
+            await rates.stop()
+            await telegram.stop()
+
+
+def print_report(results: Dict[str, object]):
+    """Imprimir los resultados en tablas legibles"""
+    print(f"\nArranque: {results['startup_s']}s   RSS máximo: {results['max_rss_mb']} MB")
+    print("\nComandos        usuarios  respondidos  descartados  req/s    p50 ms   p99 ms   upstream")
+    for phase in ('cold', 'warm'):
+        wave = results[phase]
+        print(
+            f"  {phase:<13} {wave['users']:>8}  {wave['answered']:>11}  {wave['shed']:>11}  "
+            f"{wave['throughput_per_s']:>6}  {wave['p50_ms']:>7}  {wave['p99_ms']:>7}  {wave['upstream_requests']:>8}"
+        )
+    broadcast = results['broadcast']
+    print(
+        f"\nDifusión: {broadcast['sent']}/{broadcast['subscribers']} enviadas, {broadcast['failed']} fallidas, "
+        f"{broadcast['retries']} reintentos en {broadcast['duration_s']}s "
+        f"(p50 {broadcast['p50_ms']} ms, p99 {broadcast['p99_ms']} ms), "
+        f"{broadcast['uploads']} subidas, {broadcast['upstream_requests']} peticiones upstream"
+    )
+    print(f"\nPeticiones upstream: {results['upstream']}")
+    print(f"Llamadas a la Bot API: {results['telegram_calls']} ({results['telegram_uploads']} subidas)")
+
+
+def check_thresholds(results: Dict[str, object], args: argparse.Namespace) -> List[str]:
+    """Comparar con los límites pedidos por línea de comandos"""
+    failures = []
+    if args.max_p99_ms is not None and results['warm']['p99_ms'] > args.max_p99_ms:
+        failures.append(f"p99 con caché caliente {results['warm']['p99_ms']} ms > {args.max_p99_ms} ms")
+    if args.max_upstream is not None:
+        for phase in ('cold', 'warm', 'broadcast'):
+            if results[phase]['upstream_requests'] > args.max_upstream:
+                failures.append(
+                    f"{phase}: {results[phase]['upstream_requests']} peticiones upstream > {args.max_upstream}"
+                )
+    return failures
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000, help='usuarios simultáneos por oleada de comandos')
+    parser.add_argument('--subscribers', type=int, default=2000, help='suscriptores para la difusión')
+    parser.add_argument('--concurrency', type=int, default=16, help='CONCURRENT_UPDATES')
+    parser.add_argument('--backlog-limit', type=int, default=0, help='UPDATE_BACKLOG_LIMIT (0 = sin límite)')
+    parser.add_argument('--broadcast-rate', type=float, default=1000, help='BROADCAST_GLOBAL_RATE (msg/s)')
+    parser.add_argument('--broadcast-workers', type=int, default=50, help='BROADCAST_WORKERS')
+    parser.add_argument('--upstream-latency', type=float, default=0.05, help='demora del servidor de tasas (s)')
+    parser.add_argument('--telegram-latency', type=float, default=0.02, help='demora de la Bot API (s)')
+    parser.add_argument('--flood-rate', type=float, default=0.0, help='fracción de envíos que reciben 429')
+    parser.add_argument('--log-level', default='WARNING', help='nivel de log del bot')
+    parser.add_argument('--json', type=Path, help='guardar los resultados en este archivo')
+    parser.add_argument('--max-p99-ms', type=float, help='fallar si el p99 con caché caliente lo supera')
+    parser.add_argument('--max-upstream', type=int, help='fallar si una fase hace más peticiones upstream')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    # Las rutas relativas de --json se resuelven antes de cambiar al directorio temporal
+    if args.json:
+        args.json = args.json.resolve()
+    
+    results = asyncio.run(run_benchmark(args))
+    print_report(results)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+    
+    failures = check_thresholds(results, args)
+    for failure in failures:
+        print(f"❌ {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -134,11 +134,6 @@ reinstall_dependencies() {
     
     uv sync
     
-    # Instalar navegadores de Playwright
-    print_info "Instalando navegadores de Playwright..."
-    uv run playwright install chromium
-    uv run playwright install-deps
-    
     print_success "Dependencias reinstaladas"
 }
 
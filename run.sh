@@ -128,11 +128,6 @@ install_deps() {
     # Instalar dependencias de Python
     uv sync
     
-    # Instalar navegadores de Playwright
-    print_info "Instalando navegadores de Playwright..."
-    uv run playwright install chromium
-    uv run playwright install-deps
-    
     print_success "Dependencias instaladas correctamente"
 }
 
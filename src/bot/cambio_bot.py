@@ -2,13 +2,36 @@
 Bot principal de tasas de cambio de Cuba
 """
 import asyncio
+import importlib
+import time
 from datetime import timedelta
-from telegram.ext import Application, CommandHandler, ContextTypes
-from src.config.settings import BOT_TOKEN, UPDATE_INTERVAL
+from typing import Callable, List, Optional, Union
+from telegram import Update
+from telegram.ext import Application, CommandHandler, ContextTypes, InlineQueryHandler
+from src.config.settings import (
+    BOT_TOKEN, UPDATE_INTERVAL, CHAT_ID, GROUP_ID, CHANNEL_ID, TEXT_RATE_COMMANDS,
+    BOT_MODE, LEADER_LEASE_TTL, POLL_ADAPTIVE, TELEGRAM_BASE_URL, TELEGRAM_BASE_FILE_URL,
+    STARTUP_BUDGET, ensure_directories
+)
+from src.bot.metrics_server import MetricsServer
+from src.bot.update_processor import ChatOrderedUpdateProcessor
+from src.services.chart_service import ChartService
+from src.services.extraction_service import RateExtractor
+from src.services.file_id_registry import FileIdRegistry
+from src.services.history_service import RateHistory
 from src.services.image_service import ImageService
+from src.services.leader_election import LeaderElection
+from src.services.notification_service import NotificationDispatcher
+from src.services.poll_scheduler import AdaptivePollScheduler
 from src.services.rates_service import RatesService
+from src.services.state_backend import create_state_backend
+from src.services.subscriber_service import SubscriberStore
 from src.handlers.command_handlers import CommandHandlers
+from src.handlers.inline_handlers import InlineHandlers
 from src.utils.logger import logger
+from src.utils.metrics import (
+    COMMAND_SECONDS, JOB_SECONDS, POLL_INTERVAL, STARTUP_SECONDS, SUBSCRIBERS, UPDATES
+)
 
 class CambioBot:
     """Bot principal para obtener tasas de cambio"""
@@ -19,13 +42,58 @@ class CambioBot:
         
         # Inicializar servicios
         self.image_service = ImageService()
-        self.rates_service = RatesService(self.image_service)
+        # Estado compartido entre réplicas; solo el líder ejecuta el job de actualización
+        self.state = create_state_backend()
+        # El registro de file_id se lee del disco durante el precalentamiento;
+        # file_id y suscriptores se comparten entre réplicas por el estado
+        self.file_ids = FileIdRegistry(preload=False, state=self.state)
+        self.notifier = NotificationDispatcher(self.file_ids)
+        self.subscribers = SubscriberStore(state=self.state)
+        self.extractor = RateExtractor()
+        self.history = RateHistory()
+        self.leader = LeaderElection(self.state)
+        self.rates_service = RatesService(
+            self.image_service,
+            file_ids=self.file_ids,
+            notifier=self.notifier,
+            subscribers=self.subscribers,
+            extractor=self.extractor,
+            history=self.history,
+            state=self.state
+        )
         
         # Inicializar manejadores
-        self.command_handlers = CommandHandlers(self.rates_service)
+        self.chart_service = ChartService(self.history)
+        self.poll_scheduler = AdaptivePollScheduler(self.history) if POLL_ADAPTIVE else None
+        self.command_handlers = CommandHandlers(self.rates_service, self.chart_service)
+        self.inline_handlers = InlineHandlers(self.rates_service)
         
-        # Inicializar aplicación de Telegram
-        self.app = Application.builder().token(BOT_TOKEN).build()
+        # Inicializar aplicación de Telegram (en modo webhook no hace falta el updater)
+        self.update_processor = ChatOrderedUpdateProcessor()
+        builder = (
+            Application.builder()
+            .token(BOT_TOKEN)
+            .base_url(TELEGRAM_BASE_URL)
+            .base_file_url(TELEGRAM_BASE_FILE_URL)
+            .concurrent_updates(self.update_processor)
+        )
+        if BOT_MODE == 'webhook':
+            builder = builder.updater(None)
+        self.app = builder.build()
+        self.webhook_server = None
+        if BOT_MODE == 'webhook':
+            # aiohttp.web solo hace falta en modo webhook
+            from src.bot.webhook_server import WebhookServer
+            self.webhook_server = WebhookServer(self.app)
+        self.metrics_server = MetricsServer()
+        self._warmup_task: Optional[asyncio.Task] = None
+        
+        # Métricas que se leen al exponerlas
+        UPDATES.set_function(lambda: self.update_processor.running, state='running')
+        UPDATES.set_function(lambda: self.update_processor.backlog, state='backlog')
+        SUBSCRIBERS.set_function(lambda: len(self.subscribers))
+        if self.poll_scheduler:
+            POLL_INTERVAL.set_function(lambda: self.poll_scheduler.last_delay)
         
         # Configurar manejadores
         self.setup_handlers()
@@ -33,15 +101,36 @@ class CambioBot:
     def setup_handlers(self):
         """Configurar manejadores de comandos y botones"""
         # Comandos
-        self.app.add_handler(CommandHandler("start", self.command_handlers.start_command))
-        self.app.add_handler(CommandHandler("help", self.command_handlers.help_command))
-        self.app.add_handler(CommandHandler("tasas", self.command_handlers.get_rates_command))
-        self.app.add_handler(CommandHandler("crypto", self.command_handlers.get_crypto_command))
-        self.app.add_handler(CommandHandler("trmi", self.command_handlers.get_trmi_command))
-        self.app.add_handler(CommandHandler("status", self.command_handlers.status_command))
+        self.add_command("start", self.command_handlers.start_command)
+        self.add_command("help", self.command_handlers.help_command)
+        self.add_command("tasas", self.command_handlers.get_rates_command)
+        self.add_command("crypto", self.command_handlers.get_crypto_command)
+        self.add_command("trmi", self.command_handlers.get_trmi_command)
+        self.add_command("status", self.command_handlers.status_command)
+        self.add_command("subscribe", self.command_handlers.subscribe_command)
+        self.add_command("unsubscribe", self.command_handlers.unsubscribe_command)
+        self.add_command(TEXT_RATE_COMMANDS, self.command_handlers.get_currency_command)
+        self.add_command("historial", self.command_handlers.history_command)
+        self.add_command("grafico", self.command_handlers.chart_command)
+        
+        # Consultas inline (@bot usd), respondidas solo con datos en memoria
+        self.app.add_handler(InlineQueryHandler(self.timed('inline', self.inline_handlers.inline_query)))
         
         # Botones interactivos eliminados
     
+    def add_command(self, command: Union[str, List[str]], callback: Callable):
+        """Registrar un comando midiendo su duración"""
+        label = command if isinstance(command, str) else '/'.join(command)
+        self.app.add_handler(CommandHandler(command, self.timed(label, callback)))
+    
+    def timed(self, label: str, callback: Callable) -> Callable:
+        """Envolver un manejador para medir su duración en COMMAND_SECONDS"""
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            with COMMAND_SECONDS.time(command=label):
+                await callback(update, context)
+        
+        return wrapper
+    
     async def setup_job_queue(self):
         """Configurar el job queue para actualizaciones automáticas"""
         # Conectar el bot app al rates service para notificaciones
@@ -50,22 +139,137 @@ class CambioBot:
         job_queue = self.app.job_queue
         if job_queue:
             job_queue.run_repeating(
-                self.check_updates_job,
-                interval=timedelta(minutes=UPDATE_INTERVAL),
-                first=timedelta(seconds=10)  # Primera ejecución en 10 segundos
+                self.renew_leader_job,
+                interval=timedelta(seconds=LEADER_LEASE_TTL / 3),
+                first=timedelta(seconds=0)
             )
-            logger.info(f"Job queue configurado para ejecutar cada {UPDATE_INTERVAL} minutos")
+            if self.poll_scheduler:
+                # El job se reprograma a sí mismo con el intervalo que decide el planificador
+                job_queue.run_once(self.check_updates_job, when=timedelta(seconds=10))
+                logger.info(f"Job queue configurado con intervalo adaptativo (base {UPDATE_INTERVAL} minutos)")
+            else:
+                job_queue.run_repeating(
+                    self.check_updates_job,
+                    interval=timedelta(minutes=UPDATE_INTERVAL),
+                    first=timedelta(seconds=10)  # Primera ejecución en 10 segundos
+                )
+                logger.info(f"Job queue configurado para ejecutar cada {UPDATE_INTERVAL} minutos")
         else:
             logger.warning("Job queue no disponible")
     
+    async def renew_leader_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """Job para tomar o renovar el liderazgo del job de actualización"""
+        with JOB_SECONDS.time(job='renew_leader'):
+            await self.leader.renew()
+    
     async def check_updates_job(self, context: ContextTypes.DEFAULT_TYPE):
-        """Job para verificar actualizaciones"""
-        await self.rates_service.check_for_updates()
+        """Job para verificar actualizaciones (solo en el proceso líder)"""
+        # Comparar contra los hashes guardados, no contra una caché a medio cargar
+        if self._warmup_task:
+            await asyncio.shield(self._warmup_task)
+        if not self.leader.is_leader:
+            logger.info("Otro proceso es el líder: se omite la verificación")
+            self._schedule_next_check(context, LEADER_LEASE_TTL)
+            return
+        try:
+            with JOB_SECONDS.time(job='check_updates'):
+                await self.rates_service.check_for_updates()
+        finally:
+            if self.poll_scheduler:
+                delay = self.poll_scheduler.next_delay(failed=self.rates_service.last_check_failed)
+                self._schedule_next_check(context, delay)
+    
+    def _schedule_next_check(self, context: ContextTypes.DEFAULT_TYPE, delay: float):
+        """Programar la siguiente verificación (solo con el planificador adaptativo)"""
+        if not self.poll_scheduler:
+            return
+        context.job_queue.run_once(self.check_updates_job, when=timedelta(seconds=delay))
+        logger.info(f"Próxima verificación en {delay / 60:.1f} minutos")
     
-    async def run(self):
-        """Ejecutar el bot"""
+    async def start_services(self, seed=(GROUP_ID, CHANNEL_ID, CHAT_ID)):
+        """
+        Iniciar lo imprescindible para atender comandos (sin recibir updates)
+        
+        El resto (sesión HTTP, imágenes en disco, file_id, planificador y
+        métricas) se carga después con warmup().
+        
+        Args:
+            seed: Chats que se agregan como suscriptores iniciales
+        """
+        ensure_directories()
+        await self.state.start()
+        
+        # Suscriptores (los chats del .env se agregan como suscriptores iniciales)
+        await self.subscribers.start(seed=seed)
+        await self.history.start()
+    
+    async def warmup(self):
+        """Cargar en segundo plano lo que no hace falta para el primer comando"""
+        started = time.monotonic()
+        steps = [
+            # Últimas imágenes y hashes guardados (antes de que un comando descargue otras)
+            ("imágenes guardadas", self.rates_service.initialize_hashes),
+            ("Pillow", self._import_pillow),
+            ("registro de file_id", self.file_ids.start),
+            ("sesión HTTP", self._start_http_session),
+            ("servidor de métricas", self.metrics_server.start),
+        ]
+        if self.poll_scheduler:
+            steps.append(("planificador", self.poll_scheduler.start))
+        
+        # Cada paso por separado: si uno falla (p. ej. el puerto de métricas
+        # ocupado por otra réplica) los siguientes se cargan igual
+        for name, step in steps:
+            try:
+                await step()
+            except Exception as e:
+                logger.error(f"Error en el precalentamiento ({name}): {e}")
+        
+        elapsed = time.monotonic() - started
+        STARTUP_SECONDS.set(elapsed, phase='warmup')
+        logger.info(f"Precalentamiento completado en {elapsed:.2f}s")
+    
+    async def _import_pillow(self):
+        # Pillow tampoco se importa al arrancar; cargarlo en un hilo evita que
+        # la primera imagen procesada lo importe en medio de un comando
+        await asyncio.to_thread(importlib.import_module, 'PIL.Image')
+    
+    async def _start_http_session(self):
+        # aiohttp se importa en un hilo para no frenar los comandos en curso
+        await asyncio.to_thread(importlib.import_module, 'aiohttp')
+        await self.image_service.start()
+    
+    async def stop_services(self):
+        """Detener los servicios y guardar lo pendiente"""
+        if self._warmup_task and not self._warmup_task.done():
+            self._warmup_task.cancel()
+            await asyncio.gather(self._warmup_task, return_exceptions=True)
+        # Antes de cerrar la sesión HTTP, el estado y el historial que usan
+        await self.rates_service.close()
+        await self.leader.resign()
+        await self.metrics_server.stop()
+        await self.subscribers.close()
+        await self.file_ids.flush()
+        # Después de suscriptores y file_id, que terminan de publicar ahí
+        await self.state.close()
+        self.extractor.close()
+        self.chart_service.close()
+        await self.history.close()
+        await self.image_service.close()
+    
+    async def run(self, started_at: Optional[float] = None):
+        """
+        Ejecutar el bot
+        
+        Args:
+            started_at: Momento (time.monotonic) en que arrancó el proceso,
+                para medir el tiempo hasta atender comandos
+        """
+        started_at = started_at or time.monotonic()
         logger.info("🤖 Iniciando bot de tasas de cambio de Cuba...")
         
+        await self.start_services()
+        
         # Inicializar bot primero
         await self.app.initialize()
         await self.app.start()
@@ -73,17 +277,23 @@ class CambioBot:
         # Configurar job queue después de inicializar
         await self.setup_job_queue()
         
-        # Inicializar hashes con las imágenes actuales
-        self.rates_service.initialize_hashes()
-        
-        # Iniciar polling
-        if self.app.updater:
+        # Recibir updates por webhook o por long polling
+        if self.webhook_server:
+            await self.webhook_server.start()
+        elif self.app.updater:
             await self.app.updater.start_polling()
         else:
             logger.error("Updater no disponible")
         
-        logger.info("✅ Bot iniciado correctamente!")
-        logger.info(f"📱 Comandos disponibles: /start, /help, /tasas, /crypto, /trmi, /status")
+        # Los comandos ya se atienden; el resto se carga en segundo plano
+        self._warmup_task = asyncio.create_task(self.warmup())
+        
+        startup = time.monotonic() - started_at
+        STARTUP_SECONDS.set(startup, phase='ready')
+        logger.info(f"✅ Bot iniciado correctamente en {startup:.2f}s!")
+        if startup > STARTUP_BUDGET:
+            logger.warning(f"El arranque tardó {startup:.2f}s, más que STARTUP_BUDGET ({STARTUP_BUDGET}s)")
+        logger.info(f"📱 Comandos disponibles: /start, /help, /tasas, /crypto, /trmi, /status, /subscribe, /unsubscribe, /usd, /eur, /mlc, /historial, /grafico")
         
         # Mantener el bot ejecutándose
         try:
@@ -92,7 +302,10 @@ class CambioBot:
         except KeyboardInterrupt:
             logger.info("🛑 Deteniendo bot...")
         finally:
+            if self.webhook_server:
+                await self.webhook_server.stop()
             if self.app.updater:
                 await self.app.updater.stop()
             await self.app.stop()
-            await self.app.shutdown() 
\ No newline at end of file
+            await self.app.shutdown()
+            await self.stop_services()
\ No newline at end of file
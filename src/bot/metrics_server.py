@@ -0,0 +1,50 @@
+"""
+Servidor HTTP local que expone las métricas del bot
+"""
+from typing import TYPE_CHECKING, Optional
+from src.config.settings import METRICS_LISTEN, METRICS_PORT
+from src.utils.logger import logger
+from src.utils.metrics import MetricsRegistry, registry
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class MetricsServer:
+    """Sirve GET /metrics en formato de texto de Prometheus"""
+    
+    def __init__(
+        self,
+        metrics: MetricsRegistry = registry,
+        listen: str = METRICS_LISTEN,
+        port: int = METRICS_PORT
+    ):
+        self.metrics = metrics
+        self.listen = listen
+        self.port = port
+        self._runner: Optional['web.AppRunner'] = None
+    
+    async def start(self):
+        """Levantar el servidor (no hace nada si METRICS_PORT es 0)"""
+        if not self.port:
+            return
+        # aiohttp.web solo se importa si el endpoint está activo
+        from aiohttp import web
+        web_app = web.Application()
+        web_app.router.add_get('/metrics', self._handle_metrics)
+        self._runner = web.AppRunner(web_app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        logger.info(f"Métricas disponibles en http://{self.listen}:{self.port}/metrics")
+    
+    async def stop(self):
+        """Detener el servidor"""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+    
+    async def _handle_metrics(self, request: 'web.Request') -> 'web.Response':
+        from aiohttp import web
+        return web.Response(body=self.metrics.render().encode(), headers={'Content-Type': CONTENT_TYPE})
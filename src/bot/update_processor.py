@@ -0,0 +1,169 @@
+"""
+Procesamiento concurrente de updates con orden por chat y control de carga
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Dict, Hashable, List, Optional, Tuple
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from src.config.settings import (
+    CONCURRENT_UPDATES, UPDATE_BACKLOG_LIMIT, DUPLICATE_COMMAND_WINDOW
+)
+from src.utils.logger import logger
+
+# Límite de admisión que se le pasa a PTB: el control real lo hace el procesador
+ADMISSION_LIMIT = 2 ** 31
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Ejecuta handlers en paralelo sin desordenar los updates de un mismo chat
+    
+    - Como máximo `concurrency` handlers corren a la vez; el resto espera en
+      el backlog. Un chat solo ocupa un hueco cuando le toca su turno, así un
+      chat con muchos mensajes no acapara la concurrencia.
+    - Si el backlog alcanza `backlog_limit` los updates nuevos se descartan
+      (0 = sin límite, solo se encolan).
+    - El mismo comando del mismo usuario en el mismo chat dentro de
+      `duplicate_window` segundos se ignora.
+    """
+    
+    def __init__(
+        self,
+        concurrency: int = CONCURRENT_UPDATES,
+        backlog_limit: int = UPDATE_BACKLOG_LIMIT,
+        duplicate_window: float = DUPLICATE_COMMAND_WINDOW
+    ):
+        if concurrency < 1:
+            raise ValueError("CONCURRENT_UPDATES debe ser al menos 1")
+        super().__init__(ADMISSION_LIMIT)
+        self.concurrency = concurrency
+        self.backlog_limit = backlog_limit
+        self.duplicate_window = duplicate_window
+        self._slots: Optional[asyncio.Semaphore] = None
+        # chat -> (lock, updates de ese chat dentro del procesador)
+        self._chat_locks: Dict[Hashable, Tuple[asyncio.Lock, int]] = {}
+        # (usuario, chat, comando) -> último momento en que se recibió
+        self._recent_commands: Dict[Tuple[Any, Any, str], float] = {}
+        self.pending = 0
+        self.running = 0
+        self.processed = 0
+        self.shed = 0
+        self.duplicates = 0
+    
+    @property
+    def backlog(self) -> int:
+        """Updates admitidos que todavía esperan su turno"""
+        return self.pending - self.running
+    
+    def stats(self) -> Dict[str, int]:
+        """Contadores actuales del procesador"""
+        return {
+            'running': self.running,
+            'backlog': self.backlog,
+            'processed': self.processed,
+            'shed': self.shed,
+            'duplicates': self.duplicates,
+        }
+    
+    async def initialize(self):
+        """Crear el semáforo dentro del event loop de la aplicación"""
+        self._slots = asyncio.Semaphore(self.concurrency)
+    
+    async def shutdown(self):
+        """Reportar lo que quedó pendiente"""
+        if self.pending:
+            logger.warning(f"Procesador detenido con {self.pending} updates pendientes")
+    
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]):
+        """Filtrar duplicados y exceso de carga; luego ejecutar respetando el orden del chat"""
+        if self._is_duplicate(update):
+            self.duplicates += 1
+            self._discard(coroutine)
+            return
+        
+        if self.backlog_limit and self.backlog >= self.backlog_limit:
+            self.shed += 1
+            self._discard(coroutine)
+            logger.warning(f"Backlog lleno ({self.backlog} updates): update descartado")
+            return
+        
+        chat_key = self._chat_key(update)
+        self.pending += 1
+        try:
+            if chat_key is None:
+                await self._run(coroutine)
+            else:
+                lock = self._acquire_chat(chat_key)
+                try:
+                    async with lock:
+                        await self._run(coroutine)
+                finally:
+                    self._release_chat(chat_key)
+        finally:
+            self.pending -= 1
+    
+    async def _run(self, coroutine: Awaitable[Any]):
+        """Esperar un hueco de concurrencia y ejecutar el handler"""
+        async with self._slots:
+            self.running += 1
+            try:
+                await coroutine
+            finally:
+                self.running -= 1
+                self.processed += 1
+    
+    def _acquire_chat(self, chat_key: Hashable) -> asyncio.Lock:
+        """Obtener el lock del chat registrando un usuario más"""
+        lock, users = self._chat_locks.get(chat_key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._chat_locks[chat_key] = (lock, users + 1)
+        return lock
+    
+    def _release_chat(self, chat_key: Hashable):
+        """Liberar el lock del chat cuando ya no lo usa nadie"""
+        lock, users = self._chat_locks[chat_key]
+        if users <= 1:
+            del self._chat_locks[chat_key]
+        else:
+            self._chat_locks[chat_key] = (lock, users - 1)
+    
+    def _chat_key(self, update: object) -> Optional[Hashable]:
+        """Chat al que pertenece el update (None si no tiene, p. ej. inline queries)"""
+        if isinstance(update, Update) and update.effective_chat:
+            return update.effective_chat.id
+        return None
+    
+    def _is_duplicate(self, update: object) -> bool:
+        """Comprobar si el comando se repitió dentro de la ventana"""
+        if not self.duplicate_window or not isinstance(update, Update):
+            return False
+        message = update.message
+        if not message or not message.text or not message.text.startswith('/'):
+            return False
+        
+        user_id = message.from_user.id if message.from_user else None
+        key = (user_id, message.chat_id, message.text.strip().lower())
+        now = time.monotonic()
+        last = self._recent_commands.get(key)
+        self._recent_commands[key] = now
+        self._prune_commands(now)
+        return last is not None and now - last < self.duplicate_window
+    
+    def _prune_commands(self, now: float):
+        """Olvidar comandos fuera de la ventana para que el diccionario no crezca"""
+        if len(self._recent_commands) < 1024:
+            return
+        expired: List[Tuple[Any, Any, str]] = [
+            key for key, seen in self._recent_commands.items()
+            if now - seen >= self.duplicate_window
+        ]
+        for key in expired:
+            del self._recent_commands[key]
+    
+    def _discard(self, coroutine: Awaitable[Any]):
+        """Cerrar la corrutina de un update que no se va a ejecutar"""
+        close = getattr(coroutine, 'close', None)
+        if close:
+            close()
@@ -0,0 +1,95 @@
+"""
+Servidor HTTP embebido para recibir updates de Telegram por webhook
+"""
+import hmac
+from typing import Optional
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+from src.config.settings import (
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_SECRET,
+    WEBHOOK_MAX_CONNECTIONS
+)
+from src.utils.logger import logger
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class WebhookServer:
+    """
+    Recibe updates por HTTP y los encola en la aplicación de Telegram
+    
+    El handler solo valida y encola, así Telegram recibe el 200 enseguida y
+    el procesamiento ocurre en los workers de la aplicación. Como el estado
+    de cada update viaja en la petición, varios procesos pueden atender la
+    misma URL detrás de un balanceador.
+    """
+    
+    def __init__(
+        self,
+        app: Application,
+        url: str = WEBHOOK_URL,
+        path: str = WEBHOOK_PATH,
+        listen: str = WEBHOOK_LISTEN,
+        port: int = WEBHOOK_PORT,
+        secret: str = WEBHOOK_SECRET,
+        max_connections: int = WEBHOOK_MAX_CONNECTIONS
+    ):
+        self.app = app
+        self.url = url
+        self.path = path
+        self.listen = listen
+        self.port = port
+        self.secret = secret
+        self.max_connections = max_connections
+        self.web_app = web.Application()
+        self.web_app.router.add_post(self.path, self._handle_update)
+        self.web_app.router.add_get('/health', self._handle_health)
+        self._runner: Optional[web.AppRunner] = None
+    
+    async def start(self):
+        """Levantar el servidor y registrar el webhook en Telegram"""
+        if not self.url:
+            raise ValueError("WEBHOOK_URL no está configurado")
+        if not self.secret:
+            logger.warning("WEBHOOK_SECRET vacío: el webhook acepta peticiones de cualquiera")
+        
+        self._runner = web.AppRunner(self.web_app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        logger.info(f"Servidor webhook escuchando en {self.listen}:{self.port}{self.path}")
+        
+        await self.app.bot.set_webhook(
+            url=f"{self.url}{self.path}",
+            secret_token=self.secret or None,
+            max_connections=self.max_connections,
+            allowed_updates=Update.ALL_TYPES
+        )
+        logger.info(f"Webhook registrado en {self.url}{self.path}")
+    
+    async def stop(self):
+        """Detener el servidor (el webhook queda registrado para las demás instancias)"""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+            logger.info("Servidor webhook detenido")
+    
+    async def _handle_update(self, request: web.Request) -> web.Response:
+        """Validar el secreto, decodificar el update y encolarlo"""
+        if self.secret:
+            received = request.headers.get(SECRET_HEADER, '')
+            if not hmac.compare_digest(received, self.secret):
+                return web.Response(status=403)
+        
+        try:
+            update = Update.de_json(await request.json(), self.app.bot)
+        except Exception as e:
+            logger.warning(f"Update inválido recibido por webhook: {e}")
+            return web.Response(status=400)
+        
+        await self.app.update_queue.put(update)
+        return web.Response()
+    
+    async def _handle_health(self, request: web.Request) -> web.Response:
+        """Chequeo de salud para el balanceador"""
+        return web.Response(text='ok')
@@ -1,31 +1,178 @@
 """
 Configuración centralizada del bot
+
+Importar este módulo no tiene efectos secundarios: los puntos de entrada
+cargan el .env antes de importarlo y los directorios se crean al arrancar
+con ensure_directories().
 """
 import os
 from pathlib import Path
-from dotenv import load_dotenv
-
-# Cargar variables de entorno
-load_dotenv()
 
 # Configuración del bot
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+# Servidor de la Bot API (un telegram-bot-api propio o un servidor falso para benchmarks)
+TELEGRAM_BASE_URL = os.getenv('TELEGRAM_BASE_URL', 'https://api.telegram.org/bot')
+TELEGRAM_BASE_FILE_URL = os.getenv('TELEGRAM_BASE_FILE_URL', 'https://api.telegram.org/file/bot')
 CHAT_ID = os.getenv('CHAT_ID')
 GROUP_ID = os.getenv('GROUP_ID', '4664753197')
 CHANNEL_ID = os.getenv('CHANNEL_ID', '2821523577')
 UPDATE_INTERVAL = int(os.getenv('UPDATE_INTERVAL', 30))
 
+# Verificación adaptativa: aprende en qué franjas del día cambian las tasas,
+# consulta cada POLL_MIN_INTERVAL segundos cerca de ellas y espacia las
+# consultas (hasta POLL_MAX_INTERVAL) fuera de ellas o ante errores
+POLL_ADAPTIVE = os.getenv('POLL_ADAPTIVE', 'true').lower() == 'true'
+POLL_MIN_INTERVAL = float(os.getenv('POLL_MIN_INTERVAL', 60))
+POLL_MAX_INTERVAL = float(os.getenv('POLL_MAX_INTERVAL', UPDATE_INTERVAL * 60 * 4))
+POLL_SLOT_MINUTES = int(os.getenv('POLL_SLOT_MINUTES', 15))
+# Fracción de los días con cambios en una franja para considerarla activa
+POLL_WINDOW_PROBABILITY = float(os.getenv('POLL_WINDOW_PROBABILITY', 0.3))
+POLL_LEARN_DAYS = int(os.getenv('POLL_LEARN_DAYS', 14))
+POLL_MIN_DAYS = int(os.getenv('POLL_MIN_DAYS', 3))
+
+# Recepción de updates: 'polling' (long polling) o 'webhook' (servidor HTTP propio)
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+# URL pública (https) por la que Telegram llega al servidor, sin la ruta
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '').rstrip('/')
+WEBHOOK_PATH = '/' + os.getenv('WEBHOOK_PATH', 'telegram').strip('/')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8080))
+# Telegram lo envía en X-Telegram-Bot-Api-Secret-Token; se rechazan peticiones sin él
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40))
+
+# Updates procesados a la vez; los de un mismo chat siempre van en orden
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', 16))
+# Updates en espera a partir de los cuales se descartan los nuevos (0 = sin límite)
+UPDATE_BACKLOG_LIMIT = int(os.getenv('UPDATE_BACKLOG_LIMIT', 500))
+# Segundos en los que se ignora el mismo comando repetido por el mismo usuario (0 = desactivado)
+DUPLICATE_COMMAND_WINDOW = float(os.getenv('DUPLICATE_COMMAND_WINDOW', 3))
+
 # URLs de las tasas de cambio
 CRYPTO_URL = os.getenv('CRYPTO_URL', 'https://wa.cambiocuba.money/crypto_trmi.png')
 TRMI_URL = os.getenv('TRMI_URL', 'https://wa.cambiocuba.money/trmi.png')
 
-# Configuración de scraping
-HEADLESS = os.getenv('HEADLESS', 'true').lower() == 'true'
-TIMEOUT = int(os.getenv('TIMEOUT', 30000))
+# Hilos dedicados a leer y escribir imágenes fuera del event loop
+IMAGE_IO_WORKERS = int(os.getenv('IMAGE_IO_WORKERS', 2))
+
+# Configuración del cliente HTTP (sesión compartida con keep-alive)
+HTTP_CONNECTION_LIMIT = int(os.getenv('HTTP_CONNECTION_LIMIT', 100))
+HTTP_CONNECTION_LIMIT_PER_HOST = int(os.getenv('HTTP_CONNECTION_LIMIT_PER_HOST', 10))
+HTTP_DNS_CACHE_TTL = int(os.getenv('HTTP_DNS_CACHE_TTL', 300))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', 60))
+HTTP_TOTAL_TIMEOUT = float(os.getenv('HTTP_TOTAL_TIMEOUT', 20))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+
+# Tiempo máximo (segundos) que un comando espera la descarga de una fuente
+RATE_FETCH_TIMEOUT = float(os.getenv('RATE_FETCH_TIMEOUT', 10))
+
+# Si el servidor no envía ETag/Last-Modified, comparar Content-Length vía HEAD
+CONDITIONAL_HEAD_FALLBACK = os.getenv('CONDITIONAL_HEAD_FALLBACK', 'true').lower() == 'true'
+
+# Descargas en streaming: tamaño máximo aceptado y tamaño de cada bloque (bytes)
+MAX_IMAGE_BYTES = int(os.getenv('MAX_IMAGE_BYTES', 10 * 1024 * 1024))
+DOWNLOAD_CHUNK_SIZE = int(os.getenv('DOWNLOAD_CHUNK_SIZE', 64 * 1024))
+
+# Circuit breaker por URL: tras CIRCUIT_FAILURE_THRESHOLD fallos seguidos se deja
+# de consultar la fuente CIRCUIT_RESET_TIMEOUT segundos (el doble tras cada prueba
+# fallida, hasta CIRCUIT_MAX_RESET_TIMEOUT) y se sirve la última imagen buena
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 3))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_TIMEOUT', 30))
+CIRCUIT_MAX_RESET_TIMEOUT = float(os.getenv('CIRCUIT_MAX_RESET_TIMEOUT', 600))
+# Reintentos de descarga con retroceso exponencial con jitter (segundos base),
+# limitados a RETRY_BUDGET_RATIO reintentos por petición más un mínimo por segundo
+DOWNLOAD_MAX_RETRIES = int(os.getenv('DOWNLOAD_MAX_RETRIES', 2))
+DOWNLOAD_RETRY_BACKOFF = float(os.getenv('DOWNLOAD_RETRY_BACKOFF', 0.5))
+RETRY_BUDGET_RATIO = float(os.getenv('RETRY_BUDGET_RATIO', 0.2))
+RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv('RETRY_BUDGET_MIN_PER_SECOND', 0.1))
+
+# Variantes optimizadas para Telegram, generadas una vez por cada imagen nueva:
+# un JPEG de hasta VARIANT_MAX_SIDE píxeles y VARIANT_MAX_BYTES bytes y una
+# tarjeta con ambas tasas que /tasas envía en una sola foto
+IMAGE_VARIANTS = os.getenv('IMAGE_VARIANTS', 'true').lower() == 'true'
+VARIANT_MAX_SIDE = int(os.getenv('VARIANT_MAX_SIDE', 1280))
+VARIANT_MAX_BYTES = int(os.getenv('VARIANT_MAX_BYTES', 200 * 1024))
+VARIANT_QUALITY = int(os.getenv('VARIANT_QUALITY', 85))
+VARIANT_MIN_QUALITY = int(os.getenv('VARIANT_MIN_QUALITY', 50))
+
+# Difusión de notificaciones (límites de Telegram: ~30 msg/s global, 20 msg/min por grupo)
+BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', 20))
+BROADCAST_GLOBAL_RATE = float(os.getenv('BROADCAST_GLOBAL_RATE', 25))
+BROADCAST_CHAT_RATE = float(os.getenv('BROADCAST_CHAT_RATE', 0.33))
+BROADCAST_MAX_RETRIES = int(os.getenv('BROADCAST_MAX_RETRIES', 3))
+
+# Caché de imágenes (segundos). Por defecto el TTL coincide con el intervalo
+# de actualización, así los comandos se sirven desde lo que descarga el job.
+RATES_CACHE_TTL = int(os.getenv('RATES_CACHE_TTL', UPDATE_INTERVAL * 60))
+RATES_CACHE_STALE_TTL = int(os.getenv('RATES_CACHE_STALE_TTL', 600))
+
+# Detección de cambios: 'visual' (diferencia de píxeles en una región) o 'md5' (bytes exactos)
+CHANGE_DETECTION = os.getenv('CHANGE_DETECTION', 'visual').lower()
+# Región de la tabla de tasas como fracciones de la imagen: izquierda,arriba,derecha,abajo.
+# Por defecto descarta la franja del título (15% superior) y la del pie con la
+# fecha y hora de generación (12% inferior), que cambian sin que cambien las tasas.
+CHANGE_REGION = tuple(float(v) for v in os.getenv('CHANGE_REGION', '0,0.15,1,0.88').split(','))
+# Hay cambio si más de CHANGE_MIN_PIXELS píxeles difieren en más de
+# CHANGE_PIXEL_TOLERANCE niveles de gris. Un dígito distinto en la tabla mueve
+# decenas de píxeles casi de blanco a negro; re-codificar la imagen (incluso
+# como JPEG de calidad 30) deja a lo sumo un par por encima de 96.
+CHANGE_PIXEL_TOLERANCE = int(os.getenv('CHANGE_PIXEL_TOLERANCE', 96))
+CHANGE_MIN_PIXELS = int(os.getenv('CHANGE_MIN_PIXELS', 10))
+
+# Extracción de tasas numéricas por OCR (requiere pytesseract y tesseract-ocr)
+EXTRACTION_ENABLED = os.getenv('EXTRACTION_ENABLED', 'true').lower() == 'true'
+EXTRACTION_WORKERS = int(os.getenv('EXTRACTION_WORKERS', 1))
+OCR_LANG = os.getenv('OCR_LANG', 'eng')
+RATE_CURRENCIES = [c.strip().upper() for c in os.getenv('RATE_CURRENCIES', 'USDT,USD,EUR,MLC,CAD,GBP,BTC').split(',') if c.strip()]
+TEXT_RATE_COMMANDS = ['usd', 'eur', 'mlc']
+
+# Modo inline (@bot usd): segundos que Telegram cachea cada respuesta y, si aún
+# no hay datos para responder, la respuesta vacía
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', 60))
+INLINE_EMPTY_CACHE_TIME = int(os.getenv('INLINE_EMPTY_CACHE_TIME', 5))
 
 # Directorios
 IMAGES_DIR = Path('images')
-IMAGES_DIR.mkdir(exist_ok=True)
+DATA_DIR = Path(os.getenv('DATA_DIR', 'data'))
+
+# Historial de tasas (SQLite con agregados por hora y día)
+HISTORY_DB = DATA_DIR / 'history.db'
+HISTORY_IMAGES_DIR = IMAGES_DIR / 'history'
+HISTORY_KEEP_IMAGES = os.getenv('HISTORY_KEEP_IMAGES', 'true').lower() == 'true'
+HISTORY_DEFAULT_CURRENCY = os.getenv('HISTORY_DEFAULT_CURRENCY', 'USD').upper()
+HISTORY_DEFAULT_DAYS = int(os.getenv('HISTORY_DEFAULT_DAYS', 7))
+HISTORY_MAX_DAYS = int(os.getenv('HISTORY_MAX_DAYS', 90))
+
+# Gráficos (/grafico): tamaño, caché LRU de gráficos renderizados y procesos de dibujo
+CHART_WIDTH = int(os.getenv('CHART_WIDTH', 800))
+CHART_HEIGHT = int(os.getenv('CHART_HEIGHT', 450))
+CHART_CACHE_SIZE = int(os.getenv('CHART_CACHE_SIZE', 32))
+CHART_WORKERS = int(os.getenv('CHART_WORKERS', 1))
+
+# Endpoint local de métricas en formato Prometheus (puerto 0 = desactivado)
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9108))
+
+# Estado compartido entre procesos: 'local' (archivos en STATE_DIR) o 'redis'
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'local').lower()
+STATE_DIR = Path(os.getenv('STATE_DIR', DATA_DIR / 'state'))
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+STATE_KEY_PREFIX = os.getenv('STATE_KEY_PREFIX', 'cambiobot:')
+# Segundos que dura el liderazgo del job de actualización sin renovarse
+LEADER_LEASE_TTL = float(os.getenv('LEADER_LEASE_TTL', 30))
+
+# Suscriptores (SQLite en modo WAL, escrituras por lotes)
+SUBSCRIBERS_DB = DATA_DIR / 'subscribers.db'
+SUBSCRIBERS_FLUSH_INTERVAL = float(os.getenv('SUBSCRIBERS_FLUSH_INTERVAL', 5))
+SUBSCRIBERS_BATCH_SIZE = int(os.getenv('SUBSCRIBERS_BATCH_SIZE', 100))
+
+# Registro persistente de file_id de Telegram (hash de imagen -> file_id)
+FILE_IDS_FILE = IMAGES_DIR / 'file_ids.json'
+FILE_IDS_MAX_ENTRIES = int(os.getenv('FILE_IDS_MAX_ENTRIES', 200))
+
+# Arranque: segundos desde el inicio del proceso hasta responder comandos;
+# si se superan se registra una advertencia
+STARTUP_BUDGET = float(os.getenv('STARTUP_BUDGET', 2))
 
 # Configuración de logging
 LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -51,6 +198,13 @@ HELP_MESSAGE = """
 /crypto - Obtener solo tasa de criptomonedas (TRMCC)
 /trmi - Obtener solo tasa del mercado informal (TRMI)
 /status - Ver estado del bot
+/subscribe - Recibir las actualizaciones en este chat
+/unsubscribe - Dejar de recibir las actualizaciones
+/usd, /eur, /mlc - Valor de la moneda en texto
+/historial [moneda] [días] - Evolución de una moneda (ej: /historial EUR 30)
+/grafico [moneda] [días] - Gráfico de la evolución de una moneda
+
+En cualquier chat escribe el @usuario del bot seguido de tasas, crypto, trmi o una moneda (ej: usd) para compartir las tasas.
 
 Las tasas se actualizan automáticamente cada {} minutos.
 """
@@ -60,13 +214,37 @@ CRYPTO_CAPTION = "📊 TRMCC - Tasa Representativa del Mercado de Criptomonedas
 TRMI_CAPTION = "📈 TRMI - Tasa Representativa del Mercado Informal"
 CRYPTO_SIMPLE_CAPTION = "📊 TRMCC - Tasa de Criptomonedas en Cuba"
 TRMI_SIMPLE_CAPTION = "📈 TRMI - Tasa del Mercado Informal"
+RATES_CARD_CAPTION = "📊 TRMCC (arriba) y 📈 TRMI (abajo) - Tasas de cambio en Cuba"
 
 # Mensajes de notificación
 CRYPTO_UPDATE_MESSAGE = "🚨 Nueva actualización en TRMCC (Criptomonedas)"
 TRMI_UPDATE_MESSAGE = "🚨 Nueva actualización en TRMI (Mercado Informal)"
 
+# Aviso en el caption cuando la fuente no responde y se envía la última imagen buena
+STALE_IMAGE_NOTE = "⚠️ La fuente no responde: imagen de hace {}"
+
+# Mensajes de tasas en texto
+RATE_VALUE_UNAVAILABLE_MESSAGE = "ℹ️ Todavía no hay un valor en texto para {}. Usa /tasas para ver las imágenes."
+
+# Mensajes de historial
+HISTORY_EMPTY_MESSAGE = "ℹ️ Todavía no hay cambios registrados en los últimos {} días."
+
+CHART_CAPTION = "📉 Evolución de {} (últimos {} días)"
+
+# Mensajes de suscripción
+SUBSCRIBED_MESSAGE = "✅ Este chat recibirá las actualizaciones de las tasas."
+ALREADY_SUBSCRIBED_MESSAGE = "ℹ️ Este chat ya está suscrito a las actualizaciones."
+UNSUBSCRIBED_MESSAGE = "🔕 Este chat ya no recibirá las actualizaciones."
+NOT_SUBSCRIBED_MESSAGE = "ℹ️ Este chat no estaba suscrito."
+ADMIN_ONLY_MESSAGE = "⛔ Solo los administradores del grupo pueden cambiar la suscripción."
+
 # Nombres de archivos
 CRYPTO_FILENAME = 'real_crypto_trmi.png'
 TRMI_FILENAME = 'trmi.png'
-CRYPTO_TEMP_FILENAME = 'real_crypto_trmi_temp.png'
-TRMI_TEMP_FILENAME = 'trmi_temp.png' 
\ No newline at end of file
+RATES_CARD_FILENAME = 'tasas.jpg' 
+
+
+def ensure_directories():
+    """Crear los directorios de imágenes y datos si no existen"""
+    IMAGES_DIR.mkdir(exist_ok=True)
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
\ No newline at end of file
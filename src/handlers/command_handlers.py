@@ -1,22 +1,44 @@
 """
 Manejadores de comandos del bot de Telegram
 """
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
 from telegram import Update, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from src.config.settings import (
     WELCOME_MESSAGE, HELP_MESSAGE, UPDATE_INTERVAL,
-    CRYPTO_CAPTION, TRMI_CAPTION, CRYPTO_SIMPLE_CAPTION, TRMI_SIMPLE_CAPTION,
-    IMAGES_DIR, CRYPTO_URL, TRMI_URL
+    CRYPTO_CAPTION, TRMI_CAPTION, CRYPTO_SIMPLE_CAPTION, TRMI_SIMPLE_CAPTION, RATES_CARD_CAPTION,
+    IMAGES_DIR, CRYPTO_URL, TRMI_URL,
+    SUBSCRIBED_MESSAGE, ALREADY_SUBSCRIBED_MESSAGE, UNSUBSCRIBED_MESSAGE,
+    NOT_SUBSCRIBED_MESSAGE, ADMIN_ONLY_MESSAGE, RATE_VALUE_UNAVAILABLE_MESSAGE,
+    HISTORY_DEFAULT_CURRENCY, HISTORY_DEFAULT_DAYS, HISTORY_MAX_DAYS, HISTORY_EMPTY_MESSAGE,
+    CHART_CAPTION
 )
-from src.services.rates_service import RatesService
+from src.bot.update_processor import ChatOrderedUpdateProcessor
+from src.services.chart_service import ChartService
+from src.services.rates_service import RatesService, CRYPTO, TRMI
 from src.utils.logger import logger
+from src.utils.metrics import (
+    CACHE_REQUESTS, COMMAND_SECONDS, DOWNLOAD_BYTES, DOWNLOAD_SECONDS, JOB_SECONDS,
+    NOTIFICATION_SECONDS, NOTIFICATIONS
+)
+
+
+def format_rate_values(currency: str, values: Dict[str, float]) -> str:
+    """Texto con el valor de una moneda en cada fuente (/usd y modo inline)"""
+    lines = [f"💵 {currency}"]
+    for source, value in values.items():
+        label = "📊 TRMCC" if source == CRYPTO else "📈 TRMI"
+        lines.append(f"{label}: {value:,.2f} CUP")
+    return "\n".join(lines)
+
 
 class CommandHandlers:
     """Manejadores de comandos del bot"""
     
-    def __init__(self, rates_service: RatesService):
+    def __init__(self, rates_service: RatesService, chart_service: Optional[ChartService] = None):
         self.rates_service = rates_service
+        self.chart_service = chart_service or ChartService(rates_service.history)
     
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Comando /start"""
@@ -37,17 +59,36 @@ class CommandHandlers:
         await update.message.reply_text("🔄 Obteniendo las tasas de cambio...")
         
         try:
-            crypto_path, trmi_path = await self.rates_service.get_both_rates()
+            crypto, trmi = await self.rates_service.get_both_rates()
             
-            if crypto_path and trmi_path:
-                await update.message.reply_photo(
-                    photo=open(crypto_path, 'rb'),
-                    caption=CRYPTO_SIMPLE_CAPTION
+            card = await self.rates_service.get_rates_card(crypto, trmi) if crypto and trmi else None
+            
+            if card:
+                # Ambas tasas en una sola foto, más liviana que el álbum
+                await self.rates_service.file_ids.send_photo(
+                    update.message.reply_photo,
+                    card,
+                    caption=RATES_CARD_CAPTION + self.rates_service.staleness_note((CRYPTO, crypto), (TRMI, trmi))
+                )
+            elif crypto and trmi:
+                await self.rates_service.file_ids.send_media_group(
+                    update.message.reply_media_group,
+                    [
+                        (crypto, CRYPTO_SIMPLE_CAPTION + self.rates_service.staleness_note((CRYPTO, crypto))),
+                        (trmi, TRMI_SIMPLE_CAPTION + self.rates_service.staleness_note((TRMI, trmi))),
+                    ]
                 )
-                await update.message.reply_photo(
-                    photo=open(trmi_path, 'rb'),
-                    caption=TRMI_SIMPLE_CAPTION
+            elif crypto or trmi:
+                # Enviar la tasa disponible aunque la otra haya fallado
+                source, image, caption = (
+                    (CRYPTO, crypto, CRYPTO_SIMPLE_CAPTION) if crypto else (TRMI, trmi, TRMI_SIMPLE_CAPTION)
                 )
+                await self.rates_service.file_ids.send_photo(
+                    update.message.reply_photo,
+                    self.rates_service.get_photo(source, image),
+                    caption=caption + self.rates_service.staleness_note((source, image))
+                )
+                await update.message.reply_text("⚠️ No se pudo obtener una de las tasas. Inténtalo de nuevo.")
             else:
                 await update.message.reply_text("❌ Error al obtener las tasas. Inténtalo de nuevo.")
         
@@ -63,11 +104,12 @@ class CommandHandlers:
         await update.message.reply_text("🔄 Obteniendo tasa de criptomonedas...")
         
         try:
-            image_path = await self.rates_service.get_crypto_rate()
-            if image_path:
-                await update.message.reply_photo(
-                    photo=open(image_path, 'rb'),
-                    caption=CRYPTO_CAPTION
+            crypto = await self.rates_service.get_crypto_rate()
+            if crypto:
+                await self.rates_service.file_ids.send_photo(
+                    update.message.reply_photo,
+                    self.rates_service.get_photo(CRYPTO, crypto),
+                    caption=CRYPTO_CAPTION + self.rates_service.staleness_note((CRYPTO, crypto))
                 )
             else:
                 await update.message.reply_text("❌ Error al obtener la tasa de criptomonedas.")
@@ -84,11 +126,12 @@ class CommandHandlers:
         await update.message.reply_text("🔄 Obteniendo tasa del mercado informal...")
         
         try:
-            image_path = await self.rates_service.get_trmi_rate()
-            if image_path:
-                await update.message.reply_photo(
-                    photo=open(image_path, 'rb'),
-                    caption=TRMI_CAPTION
+            trmi = await self.rates_service.get_trmi_rate()
+            if trmi:
+                await self.rates_service.file_ids.send_photo(
+                    update.message.reply_photo,
+                    self.rates_service.get_photo(TRMI, trmi),
+                    caption=TRMI_CAPTION + self.rates_service.staleness_note((TRMI, trmi))
                 )
             else:
                 await update.message.reply_text("❌ Error al obtener la tasa del mercado informal.")
@@ -97,12 +140,162 @@ class CommandHandlers:
             logger.error(f"Error en get_trmi_command: {e}")
             await update.message.reply_text("❌ Error al procesar tu solicitud.")
     
+    async def get_currency_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Comandos /usd, /eur, /mlc - valor de la moneda en texto"""
+        if not update.message or not update.message.text:
+            return
+        
+        # "/usd@cambiobot 10" -> "USD"
+        currency = update.message.text.split()[0].lstrip('/').split('@')[0].upper()
+        values = self.rates_service.get_rate_values(currency)
+        if not values:
+            await update.message.reply_text(RATE_VALUE_UNAVAILABLE_MESSAGE.format(currency))
+            return
+        
+        await update.message.reply_text(format_rate_values(currency, values))
+    
+    async def history_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Comando /historial [moneda] [días] - evolución de una moneda"""
+        if not update.message:
+            return
+        
+        currency, days = self._parse_history_args(context)
+        
+        try:
+            since = datetime.now() - timedelta(days=days)
+            # Un día se muestra por horas; rangos mayores, por días
+            bucket, date_format = ('hour', '%H:%M') if days == 1 else ('day', '%Y-%m-%d')
+            history = self.rates_service.history
+            
+            sections = []
+            for source, label in ((TRMI, "📈 TRMI"), (CRYPTO, "📊 TRMCC")):
+                aggregates = await history.get_aggregates(source, currency, bucket, since)
+                if aggregates:
+                    lines = [
+                        f"{a.start.strftime(date_format)}: {a.open:,.2f} → {a.close:,.2f} "
+                        f"(mín {a.low:,.2f}, máx {a.high:,.2f})"
+                        for a in aggregates
+                    ]
+                    sections.append(f"{label}\n" + "\n".join(lines))
+            
+            if not sections:
+                # Sin valores extraídos: mostrar al menos cuándo cambió cada tasa
+                for source, label in ((TRMI, "📈 TRMI"), (CRYPTO, "📊 TRMCC")):
+                    snapshots = await history.get_snapshots(source, since, limit=10)
+                    if snapshots:
+                        times = ", ".join(s.timestamp.strftime('%d/%m %H:%M') for s in snapshots)
+                        sections.append(f"{label} - cambios: {times}")
+            
+            if not sections:
+                await update.message.reply_text(HISTORY_EMPTY_MESSAGE.format(days))
+                return
+            
+            period = "último día" if days == 1 else f"últimos {days} días"
+            header = f"🗓️ Historial {currency} ({period})"
+            await update.message.reply_text(header + "\n\n" + "\n\n".join(sections))
+        
+        except Exception as e:
+            logger.error(f"Error en history_command: {e}")
+            await update.message.reply_text("❌ Error al procesar tu solicitud.")
+    
+    async def chart_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Comando /grafico [moneda] [días] - gráfico de la evolución de una moneda"""
+        if not update.message:
+            return
+        
+        currency, days = self._parse_history_args(context)
+        
+        try:
+            chart = await self.chart_service.get_chart(currency, days)
+            if not chart:
+                await update.message.reply_text(HISTORY_EMPTY_MESSAGE.format(days))
+                return
+            
+            await self.rates_service.file_ids.send_photo(
+                update.message.reply_photo,
+                chart,
+                caption=CHART_CAPTION.format(currency, days)
+            )
+        
+        except Exception as e:
+            logger.error(f"Error en chart_command: {e}")
+            await update.message.reply_text("❌ Error al procesar tu solicitud.")
+    
+    def _parse_history_args(self, context: ContextTypes.DEFAULT_TYPE) -> Tuple[str, int]:
+        """Leer [moneda] [días] de los argumentos del comando, en cualquier orden"""
+        currency = HISTORY_DEFAULT_CURRENCY
+        days = HISTORY_DEFAULT_DAYS
+        for arg in context.args or []:
+            if arg.isdigit():
+                days = max(1, min(int(arg), HISTORY_MAX_DAYS))
+            else:
+                currency = arg.upper()
+        return currency, days
+    
+    async def subscribe_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Comando /subscribe - recibir las actualizaciones en este chat"""
+        if not update.message or not update.effective_chat:
+            return
+        
+        if not await self._can_manage_subscription(update, context):
+            await update.message.reply_text(ADMIN_ONLY_MESSAGE)
+            return
+        
+        chat = update.effective_chat
+        if self.rates_service.subscribers.add(chat.id, chat.type):
+            logger.info(f"Chat {chat.id} suscrito ({chat.type})")
+            await update.message.reply_text(SUBSCRIBED_MESSAGE)
+        else:
+            await update.message.reply_text(ALREADY_SUBSCRIBED_MESSAGE)
+    
+    async def unsubscribe_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Comando /unsubscribe - dejar de recibir las actualizaciones"""
+        if not update.message or not update.effective_chat:
+            return
+        
+        if not await self._can_manage_subscription(update, context):
+            await update.message.reply_text(ADMIN_ONLY_MESSAGE)
+            return
+        
+        chat = update.effective_chat
+        if self.rates_service.subscribers.remove(chat.id):
+            logger.info(f"Chat {chat.id} dado de baja")
+            await update.message.reply_text(UNSUBSCRIBED_MESSAGE)
+        else:
+            await update.message.reply_text(NOT_SUBSCRIBED_MESSAGE)
+    
+    async def _can_manage_subscription(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+        """En grupos solo los administradores pueden cambiar la suscripción"""
+        chat = update.effective_chat
+        if chat.type == chat.PRIVATE:
+            return True
+        if not update.effective_user:
+            return False
+        
+        try:
+            member = await context.bot.get_chat_member(chat.id, update.effective_user.id)
+            return member.status in (member.ADMINISTRATOR, member.OWNER)
+        except Exception as e:
+            logger.error(f"Error verificando administrador en {chat.id}: {e}")
+            return False
+    
     async def status_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Comando /status - ver estado del bot"""
         if not update.message:
             return
             
         now = datetime.now()
+        processor = context.application.update_processor
+        if isinstance(processor, ChatOrderedUpdateProcessor):
+            load_line = (
+                f"📥 Updates: {processor.running} en curso, {processor.backlog} en espera, "
+                f"{processor.shed} descartados, {processor.duplicates} duplicados"
+            )
+        else:
+            load_line = f"📥 Updates en curso: {processor.current_concurrent_updates}"
+        
+        metrics_lines = self._metrics_summary()
+        
         status_text = f"""
 🤖 Estado del Bot
 
@@ -111,7 +304,50 @@ class CommandHandlers:
 📂 Directorio de imágenes: {IMAGES_DIR.absolute()}
 🔗 URL Crypto: {CRYPTO_URL}
 🔗 URL TRMI: {TRMI_URL}
+👥 Suscriptores: {len(self.rates_service.subscribers)}
+{self._sources_line()}
+{load_line}
+
+📊 Métricas
+{metrics_lines}
 
 ✅ Bot funcionando correctamente
         """
-        await update.message.reply_text(status_text) 
\ No newline at end of file
+        await update.message.reply_text(status_text)
+    
+    def _sources_line(self) -> str:
+        """Estado del circuit breaker de cada fuente para /status"""
+        states = []
+        for name, url in (('TRMCC', CRYPTO_URL), ('TRMI', TRMI_URL)):
+            breaker = self.rates_service.image_service.breaker(url)
+            if breaker.state == breaker.CLOSED:
+                states.append(f"{name} ✅")
+            elif breaker.state == breaker.OPEN:
+                states.append(f"{name} ⛔ (prueba en {breaker.retry_in:.0f}s)")
+            else:
+                states.append(f"{name} ⏳ probando")
+        return "🔌 Fuentes: " + ", ".join(states)
+    
+    def _metrics_summary(self) -> str:
+        """Resumen de las métricas de rendimiento para /status"""
+        def ms(seconds: Optional[float]) -> str:
+            return f"{seconds * 1000:.0f}ms" if seconds is not None else "-"
+        
+        hits = CACHE_REQUESTS.value(result='fresh') + CACHE_REQUESTS.value(result='stale')
+        # Las respuestas de respaldo (fuente caída) cuentan como consultas, no como aciertos
+        lookups = hits + CACHE_REQUESTS.value(result='miss') + CACHE_REQUESTS.value(result='fallback')
+        hit_ratio = f"{hits / lookups:.0%}" if lookups else "-"
+        
+        return "\n".join([
+            f"⬇️ Descargas: {DOWNLOAD_SECONDS.count()} "
+            f"(p50 {ms(DOWNLOAD_SECONDS.quantile(0.5))}, p99 {ms(DOWNLOAD_SECONDS.quantile(0.99))}), "
+            f"{DOWNLOAD_BYTES.value() / 1024:.0f} KB",
+            f"🗃️ Aciertos de caché: {hit_ratio} de {lookups:.0f}",
+            f"⌨️ Comandos: {COMMAND_SECONDS.count()} "
+            f"(p50 {ms(COMMAND_SECONDS.quantile(0.5))}, p99 {ms(COMMAND_SECONDS.quantile(0.99))})",
+            f"📨 Notificaciones: {NOTIFICATIONS.value(result='sent'):.0f} enviadas, "
+            f"{NOTIFICATIONS.value(result='failed'):.0f} fallidas "
+            f"(p99 {ms(NOTIFICATION_SECONDS.quantile(0.99))})",
+            f"🔄 Verificaciones: {JOB_SECONDS.count(job='check_updates')} "
+            f"(p50 {ms(JOB_SECONDS.quantile(0.5, job='check_updates'))})",
+        ])
\ No newline at end of file
@@ -0,0 +1,141 @@
+"""
+Manejador de consultas inline (@cambiobot usd) desde cualquier chat
+"""
+from typing import FrozenSet, List, Optional, Tuple
+from telegram import (
+    InlineQueryResult, InlineQueryResultArticle, InlineQueryResultCachedPhoto,
+    InputTextMessageContent, Update
+)
+from telegram.ext import ContextTypes
+from src.config.settings import (
+    CRYPTO_CAPTION, TRMI_CAPTION, RATES_CARD_CAPTION, RATE_CURRENCIES,
+    INLINE_CACHE_TIME, INLINE_EMPTY_CACHE_TIME
+)
+from src.handlers.command_handlers import format_rate_values
+from src.services.rate_cache import CachedImage
+from src.services.rates_service import RatesService, CRYPTO, TRMI
+from src.utils.logger import logger
+
+# Máximo de resultados por respuesta que acepta Telegram
+MAX_INLINE_RESULTS = 50
+
+
+class InlineHandlers:
+    """
+    Responde consultas inline solo con lo que ya está en memoria
+    
+    Nunca descarga las fuentes: usa las imágenes cacheadas (enviadas por su
+    file_id, así que solo aparecen las que ya se subieron alguna vez) y los
+    valores extraídos. Los resultados se arman una vez por cada cambio de
+    esos datos y Telegram los cachea `INLINE_CACHE_TIME` segundos.
+    """
+    
+    def __init__(self, rates_service: RatesService):
+        self.rates_service = rates_service
+        # Datos con los que se armaron los resultados actuales
+        self._key: Optional[tuple] = None
+        # (palabras clave, resultado) en el orden en que se muestran
+        self._results: List[Tuple[FrozenSet[str], InlineQueryResult]] = []
+        self._version = 0
+    
+    async def inline_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Consulta inline: tasas, crypto, trmi o una moneda (vacía = todo)"""
+        query = update.inline_query
+        if not query:
+            return
+        
+        # Cada palabra debe ser el comienzo de una palabra clave, así coincide mientras se escribe
+        words = query.query.lower().split()
+        results = [
+            result for keywords, result in self._current_results()
+            if all(any(keyword.startswith(word) for keyword in keywords) for word in words)
+        ][:MAX_INLINE_RESULTS]
+        
+        try:
+            # Sin resultados (aún no hay datos) Telegram no debe cachear la respuesta mucho tiempo
+            await query.answer(
+                results,
+                cache_time=INLINE_CACHE_TIME if results else INLINE_EMPTY_CACHE_TIME,
+                is_personal=False
+            )
+        except Exception as e:
+            logger.error(f"Error respondiendo consulta inline: {e}")
+    
+    def _current_results(self) -> List[Tuple[FrozenSet[str], InlineQueryResult]]:
+        """Resultados precalculados, rearmados solo si cambiaron los datos"""
+        crypto = self.rates_service.cache.get(CRYPTO)
+        trmi = self.rates_service.cache.get(TRMI)
+        extracted = tuple(
+            getattr(self.rates_service.extractor.get(source), 'hash', None) for source in (CRYPTO, TRMI)
+        )
+        photos = self._photos(crypto, trmi)
+        key = (
+            extracted,
+            tuple((name, file_id, caption) for name, file_id, caption, _ in photos),
+        )
+        if key != self._key:
+            self._results = self._build_results(photos)
+            self._key = key
+        return self._results
+    
+    def _photos(
+        self,
+        crypto: Optional[CachedImage],
+        trmi: Optional[CachedImage]
+    ) -> List[Tuple[str, str, str, str]]:
+        """(nombre, file_id, caption, palabras clave) de las imágenes ya subidas a Telegram"""
+        rates_service = self.rates_service
+        photos = []
+        
+        if crypto and trmi:
+            card = rates_service.cached_rates_card(crypto, trmi)
+            file_id = card and rates_service.file_ids.get(card.hash)
+            if file_id:
+                caption = RATES_CARD_CAPTION + rates_service.staleness_note((CRYPTO, crypto), (TRMI, trmi))
+                photos.append(('tasas', file_id, caption, 'tasas trmcc crypto trmi'))
+        
+        for source, entry, caption, keywords in (
+            (CRYPTO, crypto, CRYPTO_CAPTION, 'tasas trmcc crypto criptomonedas'),
+            (TRMI, trmi, TRMI_CAPTION, 'tasas trmi informal'),
+        ):
+            if not entry:
+                continue
+            # La variante optimizada si ya se envió; si no, el original de las notificaciones
+            file_id = (
+                rates_service.file_ids.get(rates_service.get_photo(source, entry).hash)
+                or rates_service.file_ids.get(entry.hash)
+            )
+            if file_id:
+                caption += rates_service.staleness_note((source, entry))
+                photos.append((source, file_id, caption, keywords))
+        return photos
+    
+    def _build_results(
+        self,
+        photos: List[Tuple[str, str, str, str]]
+    ) -> List[Tuple[FrozenSet[str], InlineQueryResult]]:
+        """Armar los resultados inline con las imágenes y los valores en texto"""
+        self._version += 1
+        results: List[Tuple[FrozenSet[str], InlineQueryResult]] = []
+        
+        for name, file_id, caption, keywords in photos:
+            results.append((frozenset(keywords.split()), InlineQueryResultCachedPhoto(
+                id=f"{name}-{self._version}",
+                photo_file_id=file_id,
+                caption=caption
+            )))
+        
+        for currency in RATE_CURRENCIES:
+            values = self.rates_service.get_rate_values(currency)
+            if not values:
+                continue
+            text = format_rate_values(currency, values)
+            results.append((frozenset({currency.lower()}), InlineQueryResultArticle(
+                id=f"{currency.lower()}-{self._version}",
+                title=f"💵 {currency}",
+                description=" · ".join(text.splitlines()[1:]),
+                input_message_content=InputTextMessageContent(text)
+            )))
+        
+        logger.debug(f"Resultados inline rearmados: {len(results)}")
+        return results
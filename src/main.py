@@ -2,17 +2,29 @@
 """
 Bot de Telegram para obtener tasas de cambio de Cuba
 Versión modularizada para mejor escalabilidad
+
+Los módulos pesados (telegram, aiohttp, Pillow) se importan dentro de
+main(), después de cargar el .env, y el tiempo de arranque se mide desde
+aquí.
 """
 
 import asyncio
-from src.bot.cambio_bot import CambioBot
-from src.utils.logger import logger
+import time
+
+STARTED_AT = time.monotonic()
+
 
 async def main():
     """Función principal"""
+    from dotenv import load_dotenv
+    load_dotenv()
+    
+    from src.bot.cambio_bot import CambioBot
+    from src.utils.logger import logger
+    
     try:
         bot = CambioBot()
-        await bot.run()
+        await bot.run(started_at=STARTED_AT)
     except ValueError as e:
         logger.error(f"Error de configuración: {e}")
         logger.error("Por favor edita el archivo .env con tu token de bot")
@@ -21,4 +33,4 @@ async def main():
         logger.error(f"Error inesperado: {e}")
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,188 @@
+"""
+Gráficos de evolución de tasas renderizados con Pillow y cacheados
+"""
+import asyncio
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from io import BytesIO
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from src.config.settings import CHART_CACHE_SIZE, CHART_WORKERS, CHART_WIDTH, CHART_HEIGHT
+from src.services.history_service import RateHistory
+from src.services.rate_cache import CachedImage
+from src.services.rates_service import CRYPTO, TRMI
+from src.utils.logger import logger
+from src.utils.single_flight import SingleFlight
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+# Etiqueta -> color de cada serie
+SERIES_COLORS = {
+    'TRMI': (33, 150, 243),
+    'TRMCC': (255, 152, 0),
+}
+
+Series = Dict[str, List[Tuple[float, float]]]
+
+
+def render_chart(title: str, series: Series, width: int = CHART_WIDTH, height: int = CHART_HEIGHT) -> bytes:
+    """
+    Dibujar un gráfico de líneas (se ejecuta en un proceso aparte)
+    
+    Args:
+        title: Título del gráfico
+        series: Etiqueta -> lista de (timestamp, valor) ordenada por tiempo
+        width: Ancho en píxeles
+        height: Alto en píxeles
+    
+    Returns:
+        Contenido PNG del gráfico
+    """
+    from PIL import Image, ImageDraw, ImageFont
+    
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=14)
+    title_font = ImageFont.load_default(size=18)
+    
+    left, right, top, bottom = 70, width - 20, 50, height - 40
+    draw.text((left, 15), title, fill='black', font=title_font)
+    
+    points = [point for values in series.values() for point in values]
+    min_ts, max_ts = min(p[0] for p in points), max(p[0] for p in points)
+    min_value, max_value = min(p[1] for p in points), max(p[1] for p in points)
+    if max_ts == min_ts:
+        max_ts = min_ts + 1
+    if max_value == min_value:
+        min_value, max_value = min_value - 1, max_value + 1
+    
+    def to_xy(ts: float, value: float) -> Tuple[float, float]:
+        x = left + (ts - min_ts) / (max_ts - min_ts) * (right - left)
+        y = bottom - (value - min_value) / (max_value - min_value) * (bottom - top)
+        return x, y
+    
+    # Cuadrícula y eje Y
+    for step in range(5):
+        value = min_value + (max_value - min_value) * step / 4
+        _, y = to_xy(min_ts, value)
+        draw.line((left, y, right, y), fill=(225, 225, 225))
+        draw.text((5, y - 8), f"{value:,.2f}", fill='black', font=font)
+    draw.rectangle((left, top, right, bottom), outline='black')
+    
+    # Eje X: fechas de inicio y fin
+    date_format = '%d/%m %H:%M' if max_ts - min_ts < 2 * 86400 else '%d/%m/%Y'
+    draw.text((left, bottom + 10), datetime.fromtimestamp(min_ts).strftime(date_format), fill='black', font=font)
+    end_label = datetime.fromtimestamp(max_ts).strftime(date_format)
+    draw.text((right - draw.textlength(end_label, font=font), bottom + 10), end_label, fill='black', font=font)
+    
+    # Series y leyenda
+    legend_x = right
+    for label, values in series.items():
+        color = SERIES_COLORS.get(label, (76, 175, 80))
+        coords = [to_xy(ts, value) for ts, value in values]
+        if len(coords) > 1:
+            draw.line(coords, fill=color, width=3)
+        for x, y in coords:
+            draw.ellipse((x - 3, y - 3, x + 3, y + 3), fill=color)
+        
+        legend_x -= draw.textlength(label, font=font) + 30
+        draw.rectangle((legend_x, 20, legend_x + 12, 32), fill=color)
+        draw.text((legend_x + 16, 18), label, fill='black', font=font)
+    
+    output = BytesIO()
+    image.save(output, 'PNG', optimize=True)
+    return output.getvalue()
+
+
+class ChartService:
+    """Genera gráficos desde el historial con una caché LRU por moneda y rango"""
+    
+    def __init__(
+        self,
+        history: RateHistory,
+        max_entries: int = CHART_CACHE_SIZE,
+        workers: int = CHART_WORKERS
+    ):
+        self.history = history
+        self.max_entries = max_entries
+        self.workers = workers
+        self._cache: "OrderedDict[Tuple[str, int], CachedImage]" = OrderedDict()
+        self._flights = SingleFlight()
+        self._executor: Optional['ProcessPoolExecutor'] = None
+        self._generation = 0
+        
+        # Un nuevo punto en el historial invalida los gráficos cacheados
+        history.add_listener(self.invalidate)
+    
+    def invalidate(self, source: Optional[str] = None):
+        """
+        Descartar los gráficos cacheados
+        
+        Args:
+            source: Fuente que cambió (cada gráfico incluye todas las fuentes)
+        """
+        if self._cache:
+            logger.info(f"Caché de gráficos invalidada ({source or 'todas las fuentes'})")
+        self._cache.clear()
+        self._generation += 1
+    
+    async def get_chart(self, currency: str, days: int) -> Optional[CachedImage]:
+        """
+        Obtener el gráfico de una moneda en los últimos días
+        
+        Args:
+            currency: Código de la moneda
+            days: Rango en días
+        
+        Returns:
+            Imagen PNG del gráfico o None si no hay datos
+        """
+        key = (currency, days)
+        chart = self._cache.get(key)
+        if chart:
+            self._cache.move_to_end(key)
+            return chart
+        return await self._flights.do(
+            (currency, days, self._generation),
+            lambda: self._build(currency, days)
+        )
+    
+    async def _build(self, currency: str, days: int) -> Optional[CachedImage]:
+        generation = self._generation
+        since = datetime.now() - timedelta(days=days)
+        # Hasta una semana se grafican cierres por hora; rangos mayores, por día
+        bucket = 'hour' if days <= 7 else 'day'
+        
+        series: Series = {}
+        for source, label in ((TRMI, 'TRMI'), (CRYPTO, 'TRMCC')):
+            aggregates = await self.history.get_aggregates(source, currency, bucket, since)
+            if aggregates:
+                series[label] = [(a.start.timestamp(), a.close) for a in aggregates]
+        if not series:
+            return None
+        
+        if self._executor is None:
+            # multiprocessing se importa recién al primer uso del pool
+            from concurrent.futures import ProcessPoolExecutor
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        
+        # La fuente por defecto de Pillow no tiene acentos: título solo ASCII
+        title = f"{currency} / CUP"
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(self._executor, render_chart, title, series)
+        
+        chart = CachedImage(data=data, hash=hashlib.md5(data).hexdigest())
+        if generation != self._generation:
+            # El historial cambió mientras se dibujaba: no cachear un gráfico viejo
+            return chart
+        self._cache[(currency, days)] = chart
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return chart
+    
+    def close(self):
+        """Cerrar el pool de procesos"""
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
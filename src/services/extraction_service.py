@@ -0,0 +1,175 @@
+"""
+Extracción de tasas numéricas desde las imágenes (OCR en un pool de procesos)
+"""
+import asyncio
+import importlib.util
+import re
+import shutil
+from dataclasses import dataclass, field
+from datetime import datetime
+from io import BytesIO
+from typing import TYPE_CHECKING, Dict, Optional
+from src.config.settings import (
+    EXTRACTION_ENABLED, EXTRACTION_WORKERS, OCR_LANG, RATE_CURRENCIES
+)
+from src.services.rate_cache import CachedImage
+from src.utils.logger import logger
+from src.utils.single_flight import SingleFlight
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+# "USD 385", "1 EUR = 410,50 CUP", "MLC: 270.00", "BTC 23,400,000.00 CUP" ...
+_RATE_PATTERN = re.compile(
+    r'\b(' + '|'.join(RATE_CURRENCIES) + r')\b\D{0,12}?'
+    r'(\d{1,3}(?:[.,]\d{3})+(?:[.,]\d{1,2})?|\d+(?:[.,]\d{1,2})?)(?!\d)',
+    re.IGNORECASE
+)
+# Separador decimal: el último punto o coma seguido de uno o dos dígitos al final
+_DECIMAL_PART = re.compile(r'[.,](\d{1,2})$')
+
+
+def parse_number(number: str) -> float:
+    """
+    Convertir un número reconocido, con o sin separadores de miles
+    
+    Examples:
+        >>> parse_number('23,400,000.00')
+        23400000.0
+        >>> parse_number('1.250,50')
+        1250.5
+        >>> parse_number('1,250')
+        1250.0
+        >>> parse_number('410,50')
+        410.5
+    """
+    decimals = _DECIMAL_PART.search(number)
+    integer = number[:decimals.start()] if decimals else number
+    integer = integer.replace(',', '').replace('.', '')
+    return float(f"{integer}.{decimals.group(1)}" if decimals else integer)
+
+
+def parse_rates(text: str) -> Dict[str, float]:
+    """
+    Extraer pares moneda/valor de un texto
+    
+    Args:
+        text: Texto reconocido en la imagen
+    
+    Returns:
+        Diccionario moneda -> valor (se conserva la primera aparición)
+    
+    Examples:
+        >>> parse_rates('BTC 23,400,000.00 CUP')
+        {'BTC': 23400000.0}
+        >>> parse_rates('USDT: 1,250.00  1 EUR = 410,50 CUP  USD 385')
+        {'USDT': 1250.0, 'EUR': 410.5, 'USD': 385.0}
+    """
+    rates: Dict[str, float] = {}
+    for currency, value in _RATE_PATTERN.findall(text):
+        currency = currency.upper()
+        if currency not in rates:
+            rates[currency] = parse_number(value)
+    return rates
+
+
+def extract_rates(image_data: bytes, lang: str = OCR_LANG) -> Dict[str, float]:
+    """
+    Reconocer las tasas de una imagen (se ejecuta en un proceso aparte)
+    
+    Args:
+        image_data: Contenido PNG de la imagen
+        lang: Idiomas de Tesseract
+    
+    Returns:
+        Diccionario moneda -> valor
+    """
+    import pytesseract
+    from PIL import Image, ImageOps
+    
+    with Image.open(BytesIO(image_data)) as image:
+        # Escala de grises, ampliación y contraste mejoran el OCR de tablas pequeñas
+        gray = ImageOps.grayscale(image)
+        gray = gray.resize((gray.width * 2, gray.height * 2), Image.LANCZOS)
+        gray = ImageOps.autocontrast(gray)
+        text = pytesseract.image_to_string(gray, lang=lang)
+    return parse_rates(text)
+
+
+def ocr_available() -> bool:
+    """Verificar si pytesseract y el binario de Tesseract están instalados"""
+    return (
+        importlib.util.find_spec('pytesseract') is not None
+        and shutil.which('tesseract') is not None
+    )
+
+
+@dataclass
+class ExtractedRates:
+    """Tasas reconocidas en una imagen concreta"""
+    values: Dict[str, float]
+    hash: str
+    extracted_at: datetime = field(default_factory=datetime.now)
+
+
+class RateExtractor:
+    """Convierte las imágenes de tasas en valores numéricos sin bloquear el event loop"""
+    
+    def __init__(self, enabled: bool = EXTRACTION_ENABLED, workers: int = EXTRACTION_WORKERS):
+        self.enabled = enabled and ocr_available()
+        self.workers = workers
+        self._executor: Optional['ProcessPoolExecutor'] = None
+        self._results: Dict[str, ExtractedRates] = {}
+        self._flights = SingleFlight()
+        
+        if enabled and not self.enabled:
+            logger.warning("Extracción de tasas deshabilitada: instala pytesseract y tesseract-ocr")
+    
+    async def extract(self, source: str, image: CachedImage) -> Optional[ExtractedRates]:
+        """
+        Extraer las tasas de una imagen si cambió desde la última extracción
+        
+        Args:
+            source: Clave de la fuente
+            image: Imagen a procesar
+        
+        Returns:
+            Tasas extraídas o None si la extracción no está disponible o falla
+        """
+        if not self.enabled:
+            return None
+        
+        current = self._results.get(source)
+        if current and current.hash == image.hash:
+            return current
+        
+        # Llamadas simultáneas para la misma imagen comparten una sola extracción
+        return await self._flights.do((source, image.hash), lambda: self._extract(source, image))
+    
+    async def _extract(self, source: str, image: CachedImage) -> Optional[ExtractedRates]:
+        if self._executor is None:
+            # multiprocessing se importa recién al primer uso del pool
+            from concurrent.futures import ProcessPoolExecutor
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        
+        loop = asyncio.get_running_loop()
+        try:
+            values = await loop.run_in_executor(self._executor, extract_rates, image.data)
+        except Exception as e:
+            logger.error(f"Error extrayendo tasas de {source}: {e}")
+            return None
+        
+        result = ExtractedRates(values=values, hash=image.hash)
+        self._results[source] = result
+        logger.info(f"Tasas extraídas de {source}: {values}")
+        return result
+    
+    def get(self, source: str) -> Optional[ExtractedRates]:
+        """Obtener las últimas tasas extraídas de una fuente"""
+        return self._results.get(source)
+    
+    def close(self):
+        """Cerrar el pool de procesos"""
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
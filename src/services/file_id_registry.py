@@ -0,0 +1,272 @@
+"""
+Registro de file_id de Telegram por hash de imagen
+"""
+import asyncio
+import json
+import os
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+from telegram import InputMediaPhoto, Message
+from telegram.error import BadRequest
+from src.config.settings import FILE_IDS_FILE, FILE_IDS_MAX_ENTRIES
+from src.services.rate_cache import CachedImage
+from src.services.state_backend import SharedHash, StateBackend
+from src.utils.logger import logger
+
+
+def _is_file_id_error(error: BadRequest) -> bool:
+    """Verificar si un BadRequest se debe a un file_id inválido o caducado"""
+    return 'file' in str(error).lower()
+
+
+class FileIdRegistry:
+    """
+    Reutiliza los file_id de Telegram para no volver a subir imágenes iguales
+    
+    Un file_id vale para todo el bot, así que con un estado compartido los
+    que sube cada réplica se publican ahí y se recargan al arrancar y antes
+    de cada difusión; un nuevo líder no vuelve a subir las imágenes.
+    """
+    
+    def __init__(
+        self,
+        path: Path = FILE_IDS_FILE,
+        max_entries: int = FILE_IDS_MAX_ENTRIES,
+        preload: bool = True,
+        state: Optional[StateBackend] = None
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self._shared = SharedHash(state, 'file_ids') if state else None
+        self._file_ids: "OrderedDict[str, str]" = OrderedDict()
+        self._save_task: Optional[asyncio.Task] = None
+        self._dirty = False
+        # Hasta leer el disco no se escribe, para no pisar el registro guardado;
+        # con preload=False la lectura se hace después con start()
+        self._loaded = False
+        if preload:
+            self.load()
+    
+    def _read(self) -> Dict[str, str]:
+        """Leer el registro guardado (bloqueante)"""
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Error cargando registro de file_id {self.path}: {e}")
+            return {}
+    
+    def _merge(self, stored: Dict[str, str]):
+        # Los file_id registrados mientras se leía el disco son más recientes
+        merged = OrderedDict(stored)
+        for image_hash, file_id in self._file_ids.items():
+            merged.pop(image_hash, None)
+            merged[image_hash] = file_id
+        while len(merged) > self.max_entries:
+            merged.popitem(last=False)
+        self._file_ids = merged
+        self._loaded = True
+        logger.info(f"Registro de file_id cargado: {len(stored)} entradas")
+        if self._dirty:
+            self.save()
+    
+    def load(self):
+        """Cargar el registro desde disco"""
+        self._merge(self._read())
+    
+    async def start(self):
+        """Cargar el registro desde disco en un hilo aparte y sumar el compartido"""
+        self._merge(await asyncio.to_thread(self._read))
+        await self.refresh()
+    
+    async def refresh(self):
+        """Sumar los file_id publicados por otras réplicas (sin estado no hace nada)"""
+        if not self._shared:
+            return
+        try:
+            shared = await self._shared.load()
+        except Exception as e:
+            logger.error(f"Error leyendo los file_id compartidos: {e}")
+            return
+        
+        changed = False
+        for image_hash, file_id in shared.items():
+            if self._file_ids.get(image_hash) != file_id:
+                self._file_ids[image_hash] = file_id
+                changed = True
+        if changed:
+            self._trim()
+            self.save()
+    
+    def _trim(self):
+        """Descartar los más antiguos por encima de max_entries"""
+        while len(self._file_ids) > self.max_entries:
+            image_hash, _ = self._file_ids.popitem(last=False)
+            if self._shared:
+                self._shared.set(image_hash, None)
+    
+    def _write(self, file_ids: Dict[str, str]):
+        """Escribir el registro en disco de forma atómica (bloqueante)"""
+        # Temporal único: otro proceso en la misma máquina puede estar guardando a la vez
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(
+            prefix=f".{self.path.name}.", suffix='.tmp', dir=self.path.parent
+        )
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(file_ids, f)
+            os.replace(temp_name, self.path)
+        except BaseException:
+            Path(temp_name).unlink(missing_ok=True)
+            raise
+    
+    def save(self):
+        """Guardar el registro en disco, en un hilo aparte si hay event loop"""
+        if not self._loaded:
+            self._dirty = True
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            try:
+                self._write(dict(self._file_ids))
+            except Exception as e:
+                logger.error(f"Error guardando registro de file_id {self.path}: {e}")
+            return
+        
+        self._dirty = True
+        if self._save_task is None or self._save_task.done():
+            self._save_task = asyncio.create_task(self._save_pending())
+    
+    async def _save_pending(self):
+        # Los cambios que llegan durante una escritura se agrupan en la siguiente
+        while self._dirty:
+            self._dirty = False
+            try:
+                await asyncio.to_thread(self._write, dict(self._file_ids))
+            except Exception as e:
+                logger.error(f"Error guardando registro de file_id {self.path}: {e}")
+    
+    async def flush(self):
+        """Esperar a que terminen las escrituras pendientes"""
+        if self._save_task:
+            await self._save_task
+        if self._shared:
+            await self._shared.flush()
+    
+    def get(self, image_hash: str) -> Optional[str]:
+        """
+        Obtener el file_id de una imagen
+        
+        Args:
+            image_hash: Hash del contenido de la imagen
+        
+        Returns:
+            file_id de Telegram o None si la imagen nunca se subió
+        """
+        return self._file_ids.get(image_hash)
+    
+    def set(self, image_hash: str, file_id: str):
+        """
+        Registrar el file_id de una imagen
+        
+        Args:
+            image_hash: Hash del contenido de la imagen
+            file_id: file_id devuelto por Telegram
+        """
+        if self._file_ids.get(image_hash) == file_id:
+            return
+        self._file_ids[image_hash] = file_id
+        self._file_ids.move_to_end(image_hash)
+        if self._shared:
+            self._shared.set(image_hash, file_id)
+        self._trim()
+        self.save()
+    
+    def forget(self, image_hash: str):
+        """Eliminar un file_id inválido"""
+        if self._file_ids.pop(image_hash, None) is not None:
+            if self._shared:
+                self._shared.set(image_hash, None)
+            self.save()
+    
+    async def send_photo(
+        self,
+        send: Callable[..., Awaitable[Message]],
+        image: CachedImage,
+        **kwargs
+    ) -> Message:
+        """
+        Enviar una imagen reutilizando su file_id si ya se subió antes
+        
+        Args:
+            send: Función de envío (reply_photo, send_photo parcial, ...)
+            image: Imagen a enviar
+            **kwargs: Argumentos adicionales para la función de envío
+        
+        Returns:
+            Mensaje enviado
+        """
+        file_id = self.get(image.hash)
+        if file_id:
+            try:
+                return await send(photo=file_id, **kwargs)
+            except BadRequest as e:
+                if not _is_file_id_error(e):
+                    raise
+                logger.warning(f"file_id inválido para {image.hash}, subiendo de nuevo: {e}")
+                self.forget(image.hash)
+        
+        message = await send(photo=image.data, **kwargs)
+        if message and message.photo:
+            self.set(image.hash, message.photo[-1].file_id)
+        return message
+    
+    
+    async def send_media_group(
+        self,
+        send: Callable[..., Awaitable[Sequence[Message]]],
+        images: List[Tuple[CachedImage, str]],
+        **kwargs
+    ) -> Sequence[Message]:
+        """
+        Enviar varias imágenes en un solo álbum reutilizando sus file_id
+        
+        Args:
+            send: Función de envío (reply_media_group, send_media_group parcial, ...)
+            images: Lista de (imagen, caption)
+            **kwargs: Argumentos adicionales para la función de envío
+        
+        Returns:
+            Mensajes enviados
+        """
+        def build_media(use_file_ids: bool) -> List[InputMediaPhoto]:
+            return [
+                InputMediaPhoto(
+                    media=(use_file_ids and self.get(image.hash)) or image.data,
+                    caption=caption
+                )
+                for image, caption in images
+            ]
+        
+        if any(self.get(image.hash) for image, _ in images):
+            try:
+                messages = await send(media=build_media(True), **kwargs)
+            except BadRequest as e:
+                if not _is_file_id_error(e):
+                    raise
+                logger.warning(f"file_id inválido en álbum, subiendo de nuevo: {e}")
+                for image, _ in images:
+                    self.forget(image.hash)
+                messages = await send(media=build_media(False), **kwargs)
+        else:
+            messages = await send(media=build_media(False), **kwargs)
+        
+        for (image, _), message in zip(images, messages):
+            if message.photo:
+                self.set(image.hash, message.photo[-1].file_id)
+        return messages
\ No newline at end of file
@@ -0,0 +1,278 @@
+"""
+Historial de tasas: snapshots con marca de tiempo y agregados precalculados
+"""
+import asyncio
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, TypeVar
+from src.config.settings import HISTORY_DB, HISTORY_IMAGES_DIR, HISTORY_KEEP_IMAGES
+from src.services.rate_cache import CachedImage
+from src.utils.logger import logger
+
+T = TypeVar('T')
+
+# Duración en segundos de cada cubeta de agregación
+BUCKETS = {
+    'hour': 3600,
+    'day': 86400,
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    image_hash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_snapshots_source_ts ON snapshots (source, ts);
+
+CREATE TABLE IF NOT EXISTS rate_points (
+    source TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    value REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_points_series_ts ON rate_points (source, currency, ts);
+
+CREATE TABLE IF NOT EXISTS rate_aggregates (
+    source TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    bucket_start INTEGER NOT NULL,
+    open REAL NOT NULL,
+    high REAL NOT NULL,
+    low REAL NOT NULL,
+    close REAL NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (source, currency, bucket, bucket_start)
+);
+"""
+
+
+@dataclass
+class Snapshot:
+    """Cambio detectado en una fuente"""
+    source: str
+    timestamp: datetime
+    image_hash: str
+
+
+@dataclass
+class RateAggregate:
+    """Resumen OHLC de una moneda en una hora o un día"""
+    start: datetime
+    open: float
+    high: float
+    low: float
+    close: float
+    count: int
+
+
+class RateHistory:
+    """
+    Serie temporal append-only de los cambios de tasas en SQLite
+    
+    Todas las operaciones se ejecutan en un único hilo dedicado con su
+    propia conexión, así el event loop nunca espera al disco.
+    """
+    
+    def __init__(
+        self,
+        db_path: Path = HISTORY_DB,
+        images_dir: Path = HISTORY_IMAGES_DIR,
+        keep_images: bool = HISTORY_KEEP_IMAGES
+    ):
+        self.db_path = db_path
+        self.images_dir = images_dir
+        self.keep_images = keep_images
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='history')
+        self._conn: Optional[sqlite3.Connection] = None
+        self._last_hash: Dict[str, str] = {}
+        self._listeners: List[Callable[[str], None]] = []
+    
+    async def _run(self, func: Callable[..., T], *args) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+    
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+    
+    def _load_last_hashes(self) -> Dict[str, str]:
+        rows = self._connection().execute(
+            "SELECT source, image_hash FROM snapshots s "
+            "WHERE id = (SELECT MAX(id) FROM snapshots WHERE source = s.source)"
+        ).fetchall()
+        return dict(rows)
+    
+    async def start(self):
+        """Crear el esquema y cargar el último hash registrado por fuente"""
+        self._last_hash = await self._run(self._load_last_hashes)
+        if self.keep_images:
+            self.images_dir.mkdir(parents=True, exist_ok=True)
+    
+    async def close(self):
+        """Cerrar la conexión y el hilo de la base de datos"""
+        def close_connection():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        await self._run(close_connection)
+        self._executor.shutdown(wait=True)
+    
+    def add_listener(self, listener: Callable[[str], None]):
+        """
+        Registrar una función a llamar cuando se agrega un punto a una fuente
+        
+        Args:
+            listener: Función que recibe la clave de la fuente
+        """
+        self._listeners.append(listener)
+    
+    def _insert(self, source: str, ts: int, image: CachedImage, values: Dict[str, float]):
+        """Guardar snapshot, puntos y agregados en una transacción (bloqueante)"""
+        if self.keep_images:
+            image_file = self.images_dir / f"{image.hash}.png"
+            if not image_file.exists():
+                self.images_dir.mkdir(parents=True, exist_ok=True)
+                image_file.write_bytes(image.data)
+        
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT INTO snapshots (source, ts, image_hash) VALUES (?, ?, ?)",
+                (source, ts, image.hash)
+            )
+            conn.executemany(
+                "INSERT INTO rate_points (source, currency, ts, value) VALUES (?, ?, ?, ?)",
+                [(source, currency, ts, value) for currency, value in values.items()]
+            )
+            for bucket, seconds in BUCKETS.items():
+                conn.executemany(
+                    "INSERT INTO rate_aggregates "
+                    "(source, currency, bucket, bucket_start, open, high, low, close, count) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1) "
+                    "ON CONFLICT (source, currency, bucket, bucket_start) DO UPDATE SET "
+                    "high = MAX(high, excluded.high), low = MIN(low, excluded.low), "
+                    "close = excluded.close, count = count + 1",
+                    [
+                        (source, currency, bucket, self._bucket_start(ts, seconds),
+                         value, value, value, value)
+                        for currency, value in values.items()
+                    ]
+                )
+    
+    @staticmethod
+    def _bucket_start(ts: int, seconds: int) -> int:
+        """Inicio de la cubeta en hora local (los días empiezan a medianoche local)"""
+        offset = int(datetime.fromtimestamp(ts).astimezone().utcoffset().total_seconds())
+        return (ts + offset) // seconds * seconds - offset
+    
+    async def record(self, source: str, image: CachedImage, values: Dict[str, float]) -> bool:
+        """
+        Registrar un cambio de una fuente
+        
+        Args:
+            source: Clave de la fuente
+            image: Imagen detectada
+            values: Tasas extraídas de la imagen (puede estar vacío)
+        
+        Returns:
+            True si se registró (False si la imagen ya era la última registrada)
+        """
+        if self._last_hash.get(source) == image.hash:
+            return False
+        
+        try:
+            await self._run(self._insert, source, int(time.time()), image, values)
+        except Exception as e:
+            logger.error(f"Error guardando historial de {source}: {e}")
+            return False
+        # Solo tras guardarlo: si falló, el mismo cambio se puede volver a registrar
+        self._last_hash[source] = image.hash
+        
+        logger.info(f"Historial actualizado para {source}: {values or 'sin valores'}")
+        for listener in self._listeners:
+            listener(source)
+        return True
+    
+    def _select_aggregates(self, source: str, currency: str, bucket: str, since: int, until: int):
+        return self._connection().execute(
+            "SELECT bucket_start, open, high, low, close, count FROM rate_aggregates "
+            "WHERE source = ? AND currency = ? AND bucket = ? AND bucket_start BETWEEN ? AND ? "
+            "ORDER BY bucket_start",
+            (source, currency, bucket, since, until)
+        ).fetchall()
+    
+    async def get_aggregates(
+        self,
+        source: str,
+        currency: str,
+        bucket: str,
+        since: datetime,
+        until: Optional[datetime] = None
+    ) -> List[RateAggregate]:
+        """
+        Obtener los agregados precalculados de una moneda en un rango
+        
+        Args:
+            source: Clave de la fuente
+            currency: Código de la moneda
+            bucket: 'hour' o 'day'
+            since: Inicio del rango
+            until: Fin del rango (ahora si se omite)
+        
+        Returns:
+            Lista de agregados ordenados por fecha
+        """
+        until = until or datetime.now()
+        rows = await self._run(
+            self._select_aggregates, source, currency, bucket,
+            int(since.timestamp()), int(until.timestamp())
+        )
+        return [
+            RateAggregate(datetime.fromtimestamp(start), open_, high, low, close, count)
+            for start, open_, high, low, close, count in rows
+        ]
+    
+    def _select_snapshots(self, source: str, since: int, until: int, limit: int):
+        return self._connection().execute(
+            "SELECT ts, image_hash FROM snapshots "
+            "WHERE source = ? AND ts BETWEEN ? AND ? ORDER BY ts DESC LIMIT ?",
+            (source, since, until, limit)
+        ).fetchall()
+    
+    async def get_snapshots(
+        self,
+        source: str,
+        since: datetime,
+        until: Optional[datetime] = None,
+        limit: int = 50
+    ) -> List[Snapshot]:
+        """
+        Obtener los cambios registrados de una fuente (más recientes primero)
+        
+        Args:
+            source: Clave de la fuente
+            since: Inicio del rango
+            until: Fin del rango (ahora si se omite)
+            limit: Máximo de resultados
+        
+        Returns:
+            Lista de snapshots
+        """
+        until = until or datetime.now()
+        rows = await self._run(
+            self._select_snapshots, source,
+            int(since.timestamp()), int(until.timestamp()), limit
+        )
+        return [Snapshot(source, datetime.fromtimestamp(ts), image_hash) for ts, image_hash in rows]
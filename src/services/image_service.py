@@ -1,18 +1,321 @@
 """
 Servicio para manejo de imágenes y scraping
 """
+import asyncio
 import hashlib
-import aiohttp
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
 from pathlib import Path
-from typing import Optional
-from src.config.settings import IMAGES_DIR
+from typing import TYPE_CHECKING, BinaryIO, Callable, Dict, Optional, Sequence, Tuple, TypeVar
+from src.config.settings import (
+    IMAGES_DIR, HTTP_CONNECTION_LIMIT, HTTP_CONNECTION_LIMIT_PER_HOST,
+    HTTP_DNS_CACHE_TTL, HTTP_KEEPALIVE_TIMEOUT, HTTP_TOTAL_TIMEOUT,
+    HTTP_CONNECT_TIMEOUT, CONDITIONAL_HEAD_FALLBACK, CHANGE_REGION,
+    CHANGE_PIXEL_TOLERANCE, IMAGE_IO_WORKERS, MAX_IMAGE_BYTES, DOWNLOAD_CHUNK_SIZE,
+    VARIANT_MAX_SIDE, VARIANT_MAX_BYTES, VARIANT_QUALITY, VARIANT_MIN_QUALITY,
+    DOWNLOAD_MAX_RETRIES, DOWNLOAD_RETRY_BACKOFF
+)
+from src.utils.circuit_breaker import CircuitBreaker, RetryBudget
 from src.utils.logger import logger
+from src.utils.metrics import CIRCUIT_OPEN, DOWNLOAD_BYTES, DOWNLOAD_RETRIES, DOWNLOAD_SECONDS
+
+if TYPE_CHECKING:
+    import aiohttp
+    from PIL import Image
+
+T = TypeVar('T')
+
+
+@dataclass
+class DownloadResult:
+    """Imagen descargada junto con su hash MD5"""
+    data: bytes
+    hash: str
+    path: Optional[Path] = None
+
 
 class ImageService:
     """Servicio para manejo de imágenes"""
     
     def __init__(self):
         self.images_dir = IMAGES_DIR
+        self._session: Optional['aiohttp.ClientSession'] = None
+        # URL -> validadores HTTP de la última descarga (ETag, Last-Modified, tamaño)
+        self._validators: Dict[str, Dict[str, Optional[str]]] = {}
+        self._io_executor: Optional[ThreadPoolExecutor] = None
+        # URL -> circuit breaker; los reintentos de todas las URLs comparten presupuesto
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._retry_budget = RetryBudget()
+    
+    async def start(self):
+        """Crear la sesión HTTP compartida (pool de conexiones con keep-alive)"""
+        if self._session and not self._session.closed:
+            return
+        
+        # aiohttp tarda en importarse: se carga recién al crear la sesión
+        import aiohttp
+        
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_CONNECTION_LIMIT,
+            limit_per_host=HTTP_CONNECTION_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=HTTP_TOTAL_TIMEOUT,
+            connect=HTTP_CONNECT_TIMEOUT
+        )
+        self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        logger.info("Sesión HTTP compartida iniciada")
+    
+    async def close(self):
+        """Cerrar la sesión HTTP compartida y el executor de E/S"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+            logger.info("Sesión HTTP compartida cerrada")
+        self._session = None
+        
+        if self._io_executor:
+            self._io_executor.shutdown(wait=True)
+            self._io_executor = None
+    
+    async def get_session(self) -> 'aiohttp.ClientSession':
+        """
+        Obtener la sesión HTTP compartida, creándola si aún no existe
+        
+        Returns:
+            Sesión HTTP reutilizable
+        """
+        if not self._session or self._session.closed:
+            await self.start()
+        return self._session
+    
+    async def download(self, url: str, filename: Optional[str] = None) -> Optional[DownloadResult]:
+        """
+        Descargar una imagen en streaming, calculando su hash en la misma pasada
+        
+        Args:
+            url: URL de la imagen
+            filename: Si se indica, los bloques se escriben en disco a medida
+                que llegan y el archivo se reemplaza de forma atómica al final
+            
+        Returns:
+            Resultado de la descarga o None si falla
+        """
+        result, _ = await self._get(url, {}, filename)
+        return result
+    
+    async def download_image_data(self, url: str) -> Optional[bytes]:
+        """
+        Descargar el contenido de una imagen sin guardarlo en disco
+        
+        Args:
+            url: URL de la imagen
+            
+        Returns:
+            Bytes de la imagen o None si falla
+        """
+        result = await self.download(url)
+        return result.data if result else None
+    
+    async def download_if_modified(
+        self,
+        url: str,
+        filename: Optional[str] = None
+    ) -> Tuple[Optional[DownloadResult], bool]:
+        """
+        Descargar una imagen solo si cambió desde la última descarga
+        
+        Usa ETag / Last-Modified en una petición condicional. Si el servidor
+        no envió validadores, compara el Content-Length de una petición HEAD
+        con el de la última descarga (si CONDITIONAL_HEAD_FALLBACK está activo).
+        
+        Args:
+            url: URL de la imagen
+            filename: Archivo donde guardar la imagen si cambió
+            
+        Returns:
+            Tuple (resultado, sin_cambios): (resultado, False) si hay imagen
+            nueva, (None, True) si no cambió y (None, False) si la descarga falla
+        """
+        validators = self._validators.get(url, {})
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        
+        if (
+            not headers and validators.get('content_length') and CONDITIONAL_HEAD_FALLBACK
+            and self.is_available(url)
+        ):
+            if await self._head_content_length(url) == validators['content_length']:
+                return None, True
+        
+        return await self._get(url, headers, filename)
+    
+    async def _head_content_length(self, url: str) -> Optional[str]:
+        """Obtener el Content-Length de una URL mediante HEAD"""
+        try:
+            session = await self.get_session()
+            async with session.head(url) as response:
+                if response.status == 200:
+                    return response.headers.get('Content-Length')
+        except Exception as e:
+            logger.warning(f"Error en HEAD {url}: {e}")
+        return None
+    
+    def breaker(self, url: str) -> CircuitBreaker:
+        """Circuit breaker de una URL (se crea la primera vez)"""
+        breaker = self._breakers.get(url)
+        if breaker is None:
+            breaker = self._breakers[url] = CircuitBreaker()
+            CIRCUIT_OPEN.set_function(lambda: 0 if breaker.state == breaker.CLOSED else 1, url=url)
+        return breaker
+    
+    def is_available(self, url: str) -> bool:
+        """Verificar si el circuito de una URL está cerrado (la fuente responde)"""
+        return self.breaker(url).state == CircuitBreaker.CLOSED
+    
+    async def _get(
+        self,
+        url: str,
+        headers: Dict[str, str],
+        filename: Optional[str] = None
+    ) -> Tuple[Optional[DownloadResult], bool]:
+        """
+        GET protegido por el circuit breaker de la URL
+        
+        Con el circuito abierto falla al instante sin tocar la red. Los fallos
+        se reintentan con retroceso exponencial con jitter mientras el circuito
+        lo permita y quede presupuesto de reintentos.
+        """
+        breaker = self.breaker(url)
+        if not breaker.allow_request():
+            DOWNLOAD_RETRIES.inc(url=url, result='rejected')
+            logger.debug(f"Circuito abierto para {url}, reintento en {breaker.retry_in:.0f}s")
+            return None, False
+        
+        self._retry_budget.record_request()
+        attempt = 0
+        try:
+            while True:
+                result, not_modified = await self._timed_request(url, headers, filename)
+                if result or not_modified:
+                    breaker.record_success()
+                    return result, not_modified
+                
+                breaker.record_failure()
+                if breaker.state == breaker.OPEN:
+                    logger.warning(
+                        f"Circuito abierto para {url} tras {breaker.failures} fallos, "
+                        f"próxima prueba en {breaker.retry_in:.0f}s"
+                    )
+                    return None, False
+                if attempt >= DOWNLOAD_MAX_RETRIES or not breaker.allow_request():
+                    return None, False
+                if not self._retry_budget.try_retry():
+                    DOWNLOAD_RETRIES.inc(url=url, result='budget_exhausted')
+                    return None, False
+                
+                DOWNLOAD_RETRIES.inc(url=url, result='retry')
+                await asyncio.sleep(random.uniform(0, DOWNLOAD_RETRY_BACKOFF * 2 ** attempt))
+                attempt += 1
+        except asyncio.CancelledError:
+            # Una prueba cancelada no puede dejar el circuito medio abierto para siempre
+            if breaker.state == breaker.HALF_OPEN:
+                breaker.record_failure()
+            raise
+    
+    async def _timed_request(
+        self,
+        url: str,
+        headers: Dict[str, str],
+        filename: Optional[str] = None
+    ) -> Tuple[Optional[DownloadResult], bool]:
+        """GET medido: duración por resultado y bytes recibidos"""
+        started = time.perf_counter()
+        result, not_modified = await self._request(url, headers, filename)
+        
+        outcome = 'not_modified' if not_modified else 'ok' if result else 'error'
+        DOWNLOAD_SECONDS.observe(time.perf_counter() - started, url=url, result=outcome)
+        if result:
+            DOWNLOAD_BYTES.inc(len(result.data), url=url)
+        return result, not_modified
+    
+    async def _request(
+        self,
+        url: str,
+        headers: Dict[str, str],
+        filename: Optional[str] = None
+    ) -> Tuple[Optional[DownloadResult], bool]:
+        """GET (opcionalmente condicional) en streaming que recuerda los validadores"""
+        try:
+            session = await self.get_session()
+            async with session.get(url, headers=headers) as response:
+                if response.status == 304:
+                    return None, True
+                if response.status != 200:
+                    logger.error(f"Error HTTP {response.status} al descargar {url}")
+                    return None, False
+                
+                content_type = response.headers.get('Content-Type', '')
+                if content_type and not content_type.startswith('image/'):
+                    logger.error(f"Tipo de contenido inesperado en {url}: {content_type}")
+                    return None, False
+                if (response.content_length or 0) > MAX_IMAGE_BYTES:
+                    logger.error(f"Imagen demasiado grande en {url}: {response.content_length} bytes")
+                    return None, False
+                
+                result = await self._stream_body(response, filename)
+                if result is None:
+                    logger.error(f"Imagen demasiado grande en {url}: más de {MAX_IMAGE_BYTES} bytes")
+                    return None, False
+                
+                self._validators[url] = {
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'content_length': str(len(result.data)),
+                }
+                return result, False
+        
+        except Exception as e:
+            logger.error(f"Error descargando imagen {url}: {e}")
+            return None, False
+    
+    async def _stream_body(
+        self,
+        response: 'aiohttp.ClientResponse',
+        filename: Optional[str]
+    ) -> Optional[DownloadResult]:
+        """Leer el cuerpo por bloques: hash incremental, límite de tamaño y escritura opcional"""
+        hasher = hashlib.md5()
+        buffer = bytearray()
+        image_path = self.images_dir / filename if filename else None
+        temp = await self._run_io(self._open_temp, image_path) if image_path else None
+        
+        try:
+            async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                if len(buffer) + len(chunk) > MAX_IMAGE_BYTES:
+                    return None
+                hasher.update(chunk)
+                buffer.extend(chunk)
+                if temp:
+                    await self._run_io(temp[0].write, chunk)
+            
+            if temp:
+                await self._run_io(self._commit_temp, temp, image_path)
+                temp = None
+        finally:
+            if temp:
+                await self._run_io(self._discard_temp, temp)
+        
+        return DownloadResult(data=bytes(buffer), hash=hasher.hexdigest(), path=image_path)
     
     async def download_image(self, url: str, filename: str) -> Optional[Path]:
         """
@@ -25,58 +328,281 @@ class ImageService:
         Returns:
             Path del archivo descargado o None si falla
         """
+        result = await self.download(url, filename)
+        if result is None:
+            return None
+        
+        logger.info(f"Imagen descargada: {filename}")
+        return result.path
+    
+    async def _run_io(self, func: Callable[..., T], *args) -> T:
+        """Ejecutar una operación de disco en el executor de E/S"""
+        if self._io_executor is None:
+            self._io_executor = ThreadPoolExecutor(
+                max_workers=IMAGE_IO_WORKERS, thread_name_prefix='image-io'
+            )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._io_executor, func, *args)
+    
+    def _open_temp(self, image_path: Path) -> Tuple[BinaryIO, str]:
+        """Abrir un temporal único junto al archivo definitivo (bloqueante)"""
+        fd, temp_name = tempfile.mkstemp(
+            prefix=f".{image_path.name}.", suffix='.tmp', dir=image_path.parent
+        )
+        return os.fdopen(fd, 'wb'), temp_name
+    
+    def _commit_temp(self, temp: Tuple[BinaryIO, str], image_path: Path):
+        """Cerrar el temporal y reemplazar el definitivo (bloqueante)"""
+        temp_file, temp_name = temp
+        temp_file.close()
+        os.replace(temp_name, image_path)
+    
+    def _discard_temp(self, temp: Tuple[BinaryIO, str]):
+        """Cerrar y borrar un temporal incompleto (bloqueante)"""
+        temp_file, temp_name = temp
+        temp_file.close()
+        Path(temp_name).unlink(missing_ok=True)
+    
+    def _write_atomic(self, image_data: bytes, image_path: Path):
+        """Escribir en un temporal del mismo directorio y reemplazar (bloqueante)"""
+        temp = self._open_temp(image_path)
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        image_data = await response.read()
-                        image_path = self.images_dir / filename
-                        
-                        # Guardar imagen
-                        with open(image_path, 'wb') as f:
-                            f.write(image_data)
-                        
-                        logger.info(f"Imagen descargada: {filename}")
-                        return image_path
-                    else:
-                        logger.error(f"Error HTTP {response.status} al descargar {url}")
-                        return None
+            temp[0].write(image_data)
+            self._commit_temp(temp, image_path)
+        except BaseException:
+            self._discard_temp(temp)
+            raise
+    
+    async def write_image_atomic(self, image_data: bytes, filename: str) -> Path:
+        """
+        Guardar una imagen sin bloquear el event loop
+        
+        La escritura va a un archivo temporal único que luego reemplaza al
+        definitivo, así los lectores nunca ven una imagen a medio escribir.
         
+        Args:
+            image_data: Contenido de la imagen
+            filename: Nombre del archivo
+            
+        Returns:
+            Path del archivo guardado
+        """
+        image_path = self.images_dir / filename
+        await self._run_io(self._write_atomic, image_data, image_path)
+        return image_path
+    
+    def _read(self, image_path: Path) -> Optional[Tuple[bytes, float]]:
+        if not image_path.exists():
+            return None
+        return image_path.read_bytes(), image_path.stat().st_mtime
+    
+    async def read_image(self, filename: str) -> Optional[Tuple[bytes, float]]:
+        """
+        Leer una imagen sin bloquear el event loop
+        
+        Args:
+            filename: Nombre del archivo
+            
+        Returns:
+            Tuple (contenido, fecha de modificación) o None si no existe o falla
+        """
+        try:
+            return await self._run_io(self._read, self.images_dir / filename)
         except Exception as e:
-            logger.error(f"Error descargando imagen {url}: {e}")
+            logger.error(f"Error leyendo imagen {filename}: {e}")
+            return None
+    
+    def _encode(self, image: 'Image.Image', image_format: str, max_bytes: int = VARIANT_MAX_BYTES) -> bytes:
+        """
+        Codificar con pérdida bajando la calidad hasta no superar max_bytes
+        
+        Si ni con VARIANT_MIN_QUALITY entra, se devuelve la versión de menor calidad.
+        """
+        quality = VARIANT_QUALITY
+        while True:
+            buffer = BytesIO()
+            image.save(buffer, format=image_format, quality=quality, optimize=True)
+            if buffer.tell() <= max_bytes or quality <= VARIANT_MIN_QUALITY:
+                return buffer.getvalue()
+            quality = max(VARIANT_MIN_QUALITY, quality - 10)
+    
+    def _save_variant(self, data: bytes, image_path: Path) -> DownloadResult:
+        """Guardar una variante junto al original (bloqueante)"""
+        self._write_atomic(data, image_path)
+        return DownloadResult(data=data, hash=self.get_data_hash(data), path=image_path)
+    
+    def _render_photo(self, image_data: bytes, filename: str) -> DownloadResult:
+        """Generar y guardar el JPEG de una imagen (bloqueante, uso intensivo de CPU)"""
+        from PIL import Image
+        
+        with Image.open(BytesIO(image_data)) as original:
+            image = original.convert('RGB')
+        image.thumbnail((VARIANT_MAX_SIDE, VARIANT_MAX_SIDE), Image.LANCZOS)
+        return self._save_variant(
+            self._encode(image, 'JPEG'), self.images_dir / f"{Path(filename).stem}.jpg"
+        )
+    
+    async def build_photo(self, image_data: bytes, filename: str) -> Optional[DownloadResult]:
+        """
+        Preparar en un hilo aparte la versión de una imagen para enviar como foto
+        
+        Se guarda junto al original como <nombre>.jpg, con el lado mayor
+        limitado a VARIANT_MAX_SIDE píxeles y el peso a VARIANT_MAX_BYTES.
+        
+        Args:
+            image_data: Contenido de la imagen original
+            filename: Nombre del archivo original
+            
+        Returns:
+            JPEG generado o None si la imagen no se puede procesar
+        """
+        try:
+            return await asyncio.to_thread(self._render_photo, image_data, filename)
+        except Exception as e:
+            logger.error(f"Error generando la variante de {filename}: {e}")
             return None
     
-    def get_image_hash(self, image_path: Path) -> str:
+    def _render_card(self, images: Sequence[bytes], filename: str) -> DownloadResult:
+        """Apilar las imágenes en una sola tarjeta y guardarla (bloqueante)"""
+        from PIL import Image
+        
+        decoded = []
+        for image_data in images:
+            with Image.open(BytesIO(image_data)) as image:
+                decoded.append(image.convert('RGB'))
+        
+        # Todas al mismo ancho, separadas por una franja blanca
+        width = min(max(image.width for image in decoded), VARIANT_MAX_SIDE)
+        gap = max(8, width // 60)
+        scaled = [
+            image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+            for image in decoded
+        ]
+        height = sum(image.height for image in scaled) + gap * (len(scaled) - 1)
+        card = Image.new('RGB', (width, height), 'white')
+        top = 0
+        for image in scaled:
+            card.paste(image, (0, top))
+            top += image.height + gap
+        
+        card.thumbnail((VARIANT_MAX_SIDE, VARIANT_MAX_SIDE), Image.LANCZOS)
+        return self._save_variant(self._encode(card, 'JPEG'), self.images_dir / filename)
+    
+    async def build_card(self, images: Sequence[bytes], filename: str) -> Optional[DownloadResult]:
         """
-        Obtener hash MD5 de una imagen
+        Combinar varias imágenes en una tarjeta vertical en un hilo aparte
         
         Args:
-            image_path: Ruta de la imagen
+            images: Contenido de las imágenes, de arriba a abajo
+            filename: Nombre del archivo de la tarjeta (JPEG)
             
         Returns:
-            Hash MD5 de la imagen
+            Tarjeta generada o None si falla
         """
         try:
-            with open(image_path, 'rb') as f:
-                return hashlib.md5(f.read()).hexdigest()
+            return await asyncio.to_thread(self._render_card, images, filename)
         except Exception as e:
-            logger.error(f"Error calculando hash de {image_path}: {e}")
-            return ""
+            logger.error(f"Error generando la tarjeta {filename}: {e}")
+            return None
     
-    def move_temp_to_final(self, temp_path: Path, final_filename: str) -> Path:
+    def get_data_hash(self, image_data: bytes) -> str:
         """
-        Mover archivo temporal al definitivo
+        Obtener hash MD5 del contenido de una imagen
         
         Args:
-            temp_path: Ruta del archivo temporal
-            final_filename: Nombre del archivo final
+            image_data: Contenido de la imagen
             
         Returns:
-            Path del archivo final
+            Hash MD5 del contenido
         """
-        final_path = self.images_dir / final_filename
-        temp_path.rename(final_path)
-        return final_path
+        return hashlib.md5(image_data).hexdigest()
+    
+    def get_visual_signature(self, image_data: bytes) -> 'Image.Image':
+        """
+        Obtener la región de interés de una imagen en escala de grises
+        
+        Dos PNG visualmente iguales (re-codificados, con metadatos o
+        compresión distintos) producen la misma firma; recortar la región
+        excluye zonas como la hora de generación.
+        
+        Args:
+            image_data: Contenido de la imagen
+            
+        Returns:
+            Imagen en escala de grises de la región CHANGE_REGION
+        """
+        from PIL import Image
+        
+        with Image.open(BytesIO(image_data)) as image:
+            gray = image.convert('L')
+        left, top, right, bottom = CHANGE_REGION
+        return gray.crop((
+            int(left * gray.width), int(top * gray.height),
+            int(right * gray.width), int(bottom * gray.height)
+        ))
+    
+    def visual_distance(self, first: 'Image.Image', second: 'Image.Image') -> int:
+        """
+        Contar los píxeles que difieren más de CHANGE_PIXEL_TOLERANCE
+        
+        Args:
+            first: Firma visual de referencia
+            second: Firma visual nueva
+            
+        Returns:
+            Número de píxeles distintos (todos si cambió el tamaño)
+        """
+        from PIL import ImageChops
+        
+        if first.size != second.size:
+            return second.width * second.height
+        diff = ImageChops.difference(first, second)
+        mask = diff.point(lambda p: 255 if p > CHANGE_PIXEL_TOLERANCE else 0)
+        return mask.histogram()[255]
+    
+    async def compare_visual(
+        self,
+        baseline: Optional['Image.Image'],
+        image_data: bytes
+    ) -> Tuple[Optional['Image.Image'], Optional[int]]:
+        """
+        Calcular la firma visual y su distancia a la referencia en un hilo aparte
+        
+        Args:
+            baseline: Firma visual de referencia (o None)
+            image_data: Contenido de la nueva imagen
+            
+        Returns:
+            Tuple (firma, distancia); la distancia es None sin referencia y
+            ambos son None si la imagen no se puede decodificar
+        """
+        def compare():
+            signature = self.get_visual_signature(image_data)
+            distance = self.visual_distance(baseline, signature) if baseline is not None else None
+            return signature, distance
+        
+        try:
+            return await asyncio.to_thread(compare)
+        except Exception as e:
+            logger.error(f"Error comparando imágenes: {e}")
+            return None, None
+    
+    async def get_image_hash(self, image_path: Path) -> str:
+        """
+        Obtener hash MD5 de una imagen en disco (leída en el executor de E/S)
+        
+        Args:
+            image_path: Ruta de la imagen
+            
+        Returns:
+            Hash MD5 de la imagen
+        """
+        try:
+            image_data = await self._run_io(image_path.read_bytes)
+            return self.get_data_hash(image_data)
+        except Exception as e:
+            logger.error(f"Error calculando hash de {image_path}: {e}")
+            return ""
     
     def image_exists(self, filename: str) -> bool:
         """
@@ -0,0 +1,56 @@
+"""
+Elección de líder sobre el estado compartido
+"""
+import os
+import socket
+import uuid
+from src.config.settings import LEADER_LEASE_TTL
+from src.services.state_backend import StateBackend
+from src.utils.logger import logger
+
+
+class LeaderElection:
+    """
+    Lease renovable que decide qué proceso ejecuta los trabajos únicos
+    
+    El líder debe llamar a `renew` con más frecuencia que `ttl`; si el
+    proceso muere, el lease vence y otro lo toma en su siguiente intento.
+    """
+    
+    def __init__(self, backend: StateBackend, name: str = 'update-job', ttl: float = LEADER_LEASE_TTL):
+        self.backend = backend
+        self.name = name
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+    
+    async def renew(self) -> bool:
+        """
+        Intentar tomar o renovar el lease
+        
+        Returns:
+            True si este proceso es el líder
+        """
+        try:
+            leader = await self.backend.acquire_lock(self.name, self.owner, self.ttl)
+        except Exception as e:
+            logger.error(f"Error renovando el liderazgo de {self.name}: {e}")
+            leader = False
+        
+        if leader != self.is_leader:
+            if leader:
+                logger.info(f"Este proceso ({self.owner}) es ahora el líder de {self.name}")
+            else:
+                logger.warning(f"Este proceso ({self.owner}) dejó de ser el líder de {self.name}")
+        self.is_leader = leader
+        return leader
+    
+    async def resign(self):
+        """Soltar el lease para que otro proceso lo tome enseguida"""
+        if not self.is_leader:
+            return
+        self.is_leader = False
+        try:
+            await self.backend.release_lock(self.name, self.owner)
+        except Exception as e:
+            logger.error(f"Error soltando el liderazgo de {self.name}: {e}")
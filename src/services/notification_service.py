@@ -0,0 +1,176 @@
+"""
+Servicio de difusión de notificaciones a múltiples chats
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from functools import partial
+from typing import List, Optional, Sequence, Union
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+from src.config.settings import (
+    BROADCAST_WORKERS, BROADCAST_GLOBAL_RATE, BROADCAST_CHAT_RATE, BROADCAST_MAX_RETRIES
+)
+from src.services.file_id_registry import FileIdRegistry
+from src.services.rate_cache import CachedImage
+from src.utils.logger import logger
+from src.utils.metrics import NOTIFICATION_SECONDS, NOTIFICATIONS
+from src.utils.rate_limiter import KeyedTokenBuckets, TokenBucket
+
+ChatId = Union[int, str]
+
+
+@dataclass
+class BroadcastResult:
+    """Métricas de una difusión"""
+    sent: int = 0
+    failed: int = 0
+    retries: int = 0
+    unreachable: List[ChatId] = field(default_factory=list)
+    latencies: List[float] = field(default_factory=list)
+    duration: float = 0.0
+    
+    def percentile(self, p: float) -> float:
+        """
+        Obtener un percentil de la latencia de entrega
+        
+        Args:
+            p: Percentil entre 0 y 100
+        
+        Returns:
+            Latencia en segundos (0 si no hubo entregas)
+        """
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index]
+    
+    def summary(self) -> str:
+        """Resumen legible de la difusión"""
+        return (
+            f"{self.sent} enviadas, {self.failed} fallidas, {self.retries} reintentos "
+            f"en {self.duration:.2f}s (p50 {self.percentile(50) * 1000:.0f}ms, "
+            f"p99 {self.percentile(99) * 1000:.0f}ms)"
+        )
+
+
+class NotificationDispatcher:
+    """Difunde imágenes a muchos chats en paralelo respetando los límites de Telegram"""
+    
+    def __init__(
+        self,
+        file_ids: FileIdRegistry,
+        workers: int = BROADCAST_WORKERS,
+        global_rate: float = BROADCAST_GLOBAL_RATE,
+        chat_rate: float = BROADCAST_CHAT_RATE,
+        max_retries: int = BROADCAST_MAX_RETRIES
+    ):
+        self.file_ids = file_ids
+        self.workers = workers
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self.chat_buckets = KeyedTokenBuckets(chat_rate)
+        self.last_result: Optional[BroadcastResult] = None
+    
+    async def broadcast(
+        self,
+        bot,
+        chat_ids: Sequence[ChatId],
+        image: CachedImage,
+        caption: str
+    ) -> BroadcastResult:
+        """
+        Enviar una imagen a una lista de chats
+        
+        La imagen se sube una sola vez; el resto de envíos reutilizan su
+        file_id desde un pool acotado de workers.
+        
+        Args:
+            bot: Bot de Telegram
+            chat_ids: Chats destino
+            image: Imagen a enviar
+            caption: Texto de la notificación
+        
+        Returns:
+            Métricas de la difusión
+        """
+        result = BroadcastResult()
+        started = time.monotonic()
+        pending = list(chat_ids)
+        
+        # Subir la imagen una vez antes de repartir el file_id en paralelo
+        while pending and not self.file_ids.get(image.hash):
+            await self._deliver(bot, pending.pop(0), image, caption, result)
+        
+        queue: asyncio.Queue = asyncio.Queue()
+        for chat_id in pending:
+            queue.put_nowait(chat_id)
+        
+        async def worker():
+            while True:
+                try:
+                    chat_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await self._deliver(bot, chat_id, image, caption, result)
+        
+        await asyncio.gather(*(worker() for _ in range(min(self.workers, queue.qsize()))))
+        
+        result.duration = time.monotonic() - started
+        self.last_result = result
+        logger.info(f"Difusión completada: {result.summary()}")
+        return result
+    
+    async def _deliver(
+        self,
+        bot,
+        chat_id: ChatId,
+        image: CachedImage,
+        caption: str,
+        result: BroadcastResult
+    ) -> bool:
+        """Enviar a un chat con throttling y reintentos ante flood control"""
+        chat_bucket = self.chat_buckets.get(chat_id)
+        for attempt in range(self.max_retries + 1):
+            await self.global_bucket.acquire()
+            await chat_bucket.acquire()
+            started = time.monotonic()
+            try:
+                await self.file_ids.send_photo(
+                    partial(bot.send_photo, chat_id=chat_id),
+                    image,
+                    caption=caption
+                )
+                result.sent += 1
+                result.latencies.append(time.monotonic() - started)
+                NOTIFICATION_SECONDS.observe(time.monotonic() - started)
+                NOTIFICATIONS.inc(result='sent')
+                logger.info(f"Notificación enviada al chat {chat_id}")
+                return True
+            except RetryAfter as e:
+                delay = e.retry_after
+                if isinstance(delay, timedelta):
+                    delay = delay.total_seconds()
+                logger.warning(f"Flood control en chat {chat_id}, reintentando en {delay}s")
+                self.global_bucket.pause(delay)
+                chat_bucket.pause(delay)
+            except (Forbidden, BadRequest) as e:
+                # Bot bloqueado/expulsado o chat inexistente: no tiene sentido reintentar
+                logger.warning(f"No se puede enviar al chat {chat_id}: {e}")
+                if isinstance(e, Forbidden) or 'chat not found' in str(e).lower():
+                    result.unreachable.append(chat_id)
+                break
+            except NetworkError as e:
+                logger.warning(f"Error de red enviando al chat {chat_id}: {e}")
+                await asyncio.sleep(2 ** attempt)
+            except Exception as e:
+                logger.error(f"Error enviando notificación al chat {chat_id}: {e}")
+                break
+            if attempt < self.max_retries:
+                result.retries += 1
+                NOTIFICATIONS.inc(result='retry')
+        
+        result.failed += 1
+        NOTIFICATIONS.inc(result='failed')
+        return False
@@ -0,0 +1,155 @@
+"""
+Planificación adaptativa de las verificaciones de tasas
+"""
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set
+from src.config.settings import (
+    UPDATE_INTERVAL, POLL_MIN_INTERVAL, POLL_MAX_INTERVAL, POLL_SLOT_MINUTES,
+    POLL_WINDOW_PROBABILITY, POLL_LEARN_DAYS, POLL_MIN_DAYS
+)
+from src.services.history_service import RateHistory
+from src.services.rates_service import SOURCES
+from src.utils.logger import logger
+
+# Variación aleatoria de los intervalos (±) para no sincronizarse con el servidor
+JITTER = 0.1
+
+
+class AdaptivePollScheduler:
+    """
+    Decide cuándo volver a consultar las fuentes según cuándo suelen cambiar
+    
+    Aprende de los cambios registrados en el historial en qué franjas del día
+    (de POLL_SLOT_MINUTES minutos) se publican tasas nuevas. Cerca de esas
+    franjas consulta cada POLL_MIN_INTERVAL segundos; fuera de ellas duplica
+    el intervalo en cada verificación sin cambios, hasta POLL_MAX_INTERVAL,
+    sin pasarse del inicio de la siguiente franja. Ante errores de la fuente
+    retrocede exponencialmente. Mientras no haya POLL_MIN_DAYS días de datos
+    usa el intervalo fijo UPDATE_INTERVAL.
+    """
+    
+    def __init__(
+        self,
+        history: RateHistory,
+        base_interval: float = UPDATE_INTERVAL * 60,
+        min_interval: float = POLL_MIN_INTERVAL,
+        max_interval: float = POLL_MAX_INTERVAL,
+        slot_minutes: int = POLL_SLOT_MINUTES,
+        window_probability: float = POLL_WINDOW_PROBABILITY,
+        learn_days: int = POLL_LEARN_DAYS,
+        min_days: int = POLL_MIN_DAYS
+    ):
+        self.history = history
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, base_interval)
+        self.slot_minutes = slot_minutes
+        self.window_probability = window_probability
+        self.learn_days = learn_days
+        self.min_days = min_days
+        self.slots = 24 * 60 // slot_minutes
+        # Franja del día -> días en los que hubo algún cambio en ella
+        self._slot_days: Dict[int, Set[str]] = {}
+        self._days: Set[str] = set()
+        self._quiet_interval = base_interval
+        self.last_delay: float = base_interval
+        history.add_listener(self.record_change)
+    
+    async def start(self):
+        """Aprender el patrón de publicación a partir del historial reciente"""
+        since = datetime.now() - timedelta(days=self.learn_days)
+        timestamps: List[datetime] = []
+        for source in SOURCES:
+            try:
+                snapshots = await self.history.get_snapshots(source, since, limit=10000)
+            except Exception as e:
+                logger.error(f"Error leyendo el historial de {source} para el planificador: {e}")
+                continue
+            timestamps.extend(snapshot.timestamp for snapshot in snapshots)
+        
+        self.learn(timestamps)
+        logger.info(
+            f"Planificador: {len(timestamps)} cambios en {len(self._days)} días, "
+            f"franjas activas: {self.describe_windows() or 'ninguna'}"
+        )
+    
+    def learn(self, timestamps: Iterable[datetime]):
+        """Agregar cambios observados al modelo"""
+        for timestamp in timestamps:
+            day = timestamp.date().isoformat()
+            self._days.add(day)
+            self._slot_days.setdefault(self._slot(timestamp), set()).add(day)
+    
+    def record_change(self, source: Optional[str] = None):
+        """Registrar un cambio recién detectado (listener del historial)"""
+        self.learn([datetime.now()])
+        self._quiet_interval = self.base_interval
+    
+    def _slot(self, moment: datetime) -> int:
+        return (moment.hour * 60 + moment.minute) // self.slot_minutes
+    
+    @property
+    def trained(self) -> bool:
+        """Si hay suficientes días observados para confiar en el modelo"""
+        return len(self._days) >= self.min_days
+    
+    def is_active_slot(self, slot: int) -> bool:
+        """Si en esa franja hubo cambios en al menos POLL_WINDOW_PROBABILITY de los días"""
+        if not self._days:
+            return False
+        return len(self._slot_days.get(slot % self.slots, ())) / len(self._days) >= self.window_probability
+    
+    def describe_windows(self) -> str:
+        """Franjas activas como texto (HH:MM)"""
+        return ', '.join(
+            f"{slot * self.slot_minutes // 60:02d}:{slot * self.slot_minutes % 60:02d}"
+            for slot in range(self.slots) if self.is_active_slot(slot)
+        )
+    
+    def _seconds_to_next_window(self, now: datetime) -> Optional[float]:
+        """Segundos hasta el inicio de la próxima franja activa (None si no hay)"""
+        start_of_slot = now.replace(second=0, microsecond=0) - timedelta(
+            minutes=now.minute % self.slot_minutes
+        )
+        current = self._slot(now)
+        for ahead in range(1, self.slots + 1):
+            if self.is_active_slot(current + ahead):
+                window_start = start_of_slot + timedelta(minutes=ahead * self.slot_minutes)
+                return (window_start - now).total_seconds()
+        return None
+    
+    def next_delay(self, failed: bool = False, now: Optional[datetime] = None) -> float:
+        """
+        Calcular cuántos segundos esperar hasta la siguiente verificación
+        
+        Args:
+            failed: Si la última verificación no pudo descargar ninguna fuente
+            now: Momento actual (para pruebas)
+        
+        Returns:
+            Segundos hasta la próxima verificación
+        """
+        now = now or datetime.now()
+        
+        if failed:
+            # Duplicar la última espera (nunca menos que el intervalo normal)
+            delay = min(self.max_interval, max(self.base_interval, self.last_delay) * 2)
+        else:
+            current = self._slot(now)
+            if not self.trained:
+                delay = self.base_interval
+            elif any(self.is_active_slot(current + offset) for offset in (-1, 0, 1)):
+                # Dentro o al lado de una franja activa: consultar seguido
+                delay = self.min_interval
+                self._quiet_interval = self.base_interval
+            else:
+                delay = self._quiet_interval
+                self._quiet_interval = min(self.max_interval, self._quiet_interval * 2)
+                until_window = self._seconds_to_next_window(now)
+                if until_window is not None:
+                    delay = min(delay, max(self.min_interval, until_window))
+        
+        delay = min(self.max_interval, delay * random.uniform(1 - JITTER, 1 + JITTER))
+        self.last_delay = delay
+        return delay
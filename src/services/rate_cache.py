@@ -0,0 +1,74 @@
+"""
+Caché en memoria de las imágenes de tasas de cambio
+"""
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+from src.config.settings import RATES_CACHE_TTL, RATES_CACHE_STALE_TTL
+
+
+@dataclass
+class CachedImage:
+    """Última imagen conocida de una fuente"""
+    data: bytes
+    hash: str
+    path: Optional[Path] = None
+    fetched_at: float = field(default_factory=time.monotonic)
+    updated_at: datetime = field(default_factory=datetime.now)
+    
+    @property
+    def age(self) -> float:
+        """Segundos transcurridos desde la última descarga"""
+        return time.monotonic() - self.fetched_at
+
+
+class RateCache:
+    """Caché TTL con soporte stale-while-revalidate por fuente"""
+    
+    def __init__(self, ttl: float = RATES_CACHE_TTL, stale_ttl: float = RATES_CACHE_STALE_TTL):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries: Dict[str, CachedImage] = {}
+    
+    def get(self, source: str) -> Optional[CachedImage]:
+        """
+        Obtener la entrada de una fuente sin importar su antigüedad
+        
+        Args:
+            source: Clave de la fuente
+        
+        Returns:
+            Entrada cacheada o None
+        """
+        return self._entries.get(source)
+    
+    def set(self, source: str, entry: CachedImage):
+        """
+        Guardar la última imagen de una fuente
+        
+        Args:
+            source: Clave de la fuente
+            entry: Imagen a cachear
+        """
+        self._entries[source] = entry
+    
+    def touch(self, source: str):
+        """
+        Marcar una entrada como recién validada sin cambiar su contenido
+        
+        Args:
+            source: Clave de la fuente
+        """
+        entry = self._entries.get(source)
+        if entry:
+            entry.fetched_at = time.monotonic()
+    
+    def is_fresh(self, entry: CachedImage) -> bool:
+        """Verificar si la entrada está dentro del TTL"""
+        return entry.age < self.ttl
+    
+    def is_servable(self, entry: CachedImage) -> bool:
+        """Verificar si la entrada puede servirse mientras se revalida"""
+        return entry.age < self.ttl + self.stale_ttl
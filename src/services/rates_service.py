@@ -1,64 +1,489 @@
 """
 Servicio para manejo de tasas de cambio
 """
+import asyncio
+import json
+import time
 from datetime import datetime
-from typing import Optional, Tuple
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, Optional, Set, Tuple
 from src.config.settings import (
-    CRYPTO_URL, TRMI_URL, CHAT_ID, GROUP_ID, CHANNEL_ID, CRYPTO_FILENAME, TRMI_FILENAME,
-    CRYPTO_TEMP_FILENAME, TRMI_TEMP_FILENAME, CRYPTO_UPDATE_MESSAGE,
-    TRMI_UPDATE_MESSAGE
+    CRYPTO_URL, TRMI_URL, CRYPTO_FILENAME, TRMI_FILENAME,
+    CRYPTO_UPDATE_MESSAGE,
+    TRMI_UPDATE_MESSAGE, RATE_FETCH_TIMEOUT, CHANGE_DETECTION, CHANGE_MIN_PIXELS,
+    IMAGE_VARIANTS, RATES_CARD_FILENAME, STALE_IMAGE_NOTE
 )
-from src.services.image_service import ImageService
+from src.services.extraction_service import RateExtractor
+from src.services.file_id_registry import FileIdRegistry
+from src.services.history_service import RateHistory
+from src.services.image_service import DownloadResult, ImageService
+from src.services.notification_service import NotificationDispatcher
+from src.services.rate_cache import CachedImage, RateCache
+from src.services.state_backend import StateBackend
+from src.services.subscriber_service import SubscriberStore
 from src.utils.logger import logger
+from src.utils.metrics import CACHE_REQUESTS
+from src.utils.single_flight import SingleFlight
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+CRYPTO = 'crypto'
+TRMI = 'trmi'
+
+# Fuente -> (URL, archivo definitivo)
+SOURCES = {
+    CRYPTO: (CRYPTO_URL, CRYPTO_FILENAME),
+    TRMI: (TRMI_URL, TRMI_FILENAME),
+}
+
+
+def format_age(seconds: float) -> str:
+    """Antigüedad legible: 5 min, 2 h 10 min, 3 d 4 h"""
+    minutes = max(1, int(seconds // 60))
+    if minutes < 60:
+        return f"{minutes} min"
+    hours, minutes = divmod(minutes, 60)
+    if hours < 24:
+        return f"{hours} h {minutes} min"
+    days, hours = divmod(hours, 24)
+    return f"{days} d {hours} h"
+
 
 class RatesService:
     """Servicio para manejo de tasas de cambio"""
     
-    def __init__(self, image_service: ImageService, bot_app=None):
+    def __init__(
+        self,
+        image_service: ImageService,
+        bot_app=None,
+        file_ids: Optional[FileIdRegistry] = None,
+        notifier: Optional[NotificationDispatcher] = None,
+        subscribers: Optional[SubscriberStore] = None,
+        extractor: Optional[RateExtractor] = None,
+        history: Optional[RateHistory] = None,
+        state: Optional[StateBackend] = None
+    ):
         self.image_service = image_service
         self.bot_app = bot_app
+        self.file_ids = file_ids if file_ids is not None else FileIdRegistry()
+        self.notifier = notifier if notifier is not None else NotificationDispatcher(self.file_ids)
+        self.subscribers = subscribers if subscribers is not None else SubscriberStore()
+        self.extractor = extractor if extractor is not None else RateExtractor()
+        self.history = history if history is not None else RateHistory()
+        # Estado compartido con otros procesos del bot (None = solo memoria local)
+        self.state = state
         self.last_crypto_hash: Optional[str] = None
         self.last_trmi_hash: Optional[str] = None
+        self.cache = RateCache()
+        self._flights = SingleFlight()
+        # Firma visual de la última imagen notificada por fuente
+        self._notified_signature: Dict[str, 'Image.Image'] = {}
+        # Fuentes que ya tienen referencia (en modo md5 no hay firma visual que lo indique)
+        self._baseline_seeded: Set[str] = set()
+        self._refresh_tasks: Set[asyncio.Task] = set()
+        # Fuente -> (hash del original, JPEG optimizado para Telegram)
+        self._photos: Dict[str, Tuple[str, DownloadResult]] = {}
+        # ((hash crypto, hash trmi), tarjeta combinada de /tasas)
+        self._card: Optional[Tuple[Tuple[str, str], CachedImage]] = None
+        # Si la última verificación no pudo descargar ninguna fuente
+        self.last_check_failed = False
     
-    async def get_both_rates(self) -> Tuple[Optional[str], Optional[str]]:
+    async def get_rate(self, source: str) -> Optional[CachedImage]:
         """
-        Obtener ambas tasas de cambio
+        Obtener la última imagen de una fuente, usando la caché si es posible
+        
+        Si la entrada está vencida pero dentro del margen stale se devuelve
+        inmediatamente y se refresca en segundo plano. Con el circuito de la
+        fuente abierto tampoco se espera a la red: se sirve la última imagen
+        buena (de la caché o del disco) sin importar su antigüedad.
+        
+        Args:
+            source: Clave de la fuente (CRYPTO o TRMI)
         
         Returns:
-            Tuple con las rutas de las imágenes (crypto, trmi)
+            Imagen cacheada o None si no se pudo obtener
         """
-        crypto_path = await self.image_service.download_image(
-            CRYPTO_URL, CRYPTO_FILENAME
+        entry = self.cache.get(source)
+        if entry:
+            if self.cache.is_fresh(entry):
+                CACHE_REQUESTS.inc(source=source, result='fresh')
+                return entry
+            if self.cache.is_servable(entry):
+                CACHE_REQUESTS.inc(source=source, result='stale')
+                self._schedule_refresh(source)
+                return entry
+        
+        if not self.is_available(source):
+            entry = entry or await self._read_stored(source)
+            if entry:
+                CACHE_REQUESTS.inc(source=source, result='fallback')
+                # La petición de prueba del circuito se hace en segundo plano
+                self._schedule_refresh(source)
+                return entry
+        
+        CACHE_REQUESTS.inc(source=source, result='miss')
+        return await self.refresh_rate(source) or entry or await self._read_stored(source)
+    
+    def is_available(self, source: str) -> bool:
+        """Verificar si la fuente responde (su circuit breaker está cerrado)"""
+        return self.image_service.is_available(SOURCES[source][0])
+    
+    def staleness_note(self, *images: Tuple[str, CachedImage]) -> str:
+        """
+        Aviso de antigüedad para el caption cuando se sirve la última imagen buena
+        
+        Args:
+            images: Pares (fuente, imagen) que se envían juntos
+        
+        Returns:
+            Texto a agregar al caption o '' si las fuentes responden
+        """
+        ages = [
+            image.age for source, image in images
+            if not self.is_available(source) or not self.cache.is_servable(image)
+        ]
+        if not ages:
+            return ''
+        return "\n\n" + STALE_IMAGE_NOTE.format(format_age(max(ages)))
+    
+    async def refresh_rate(self, source: str, use_shared: bool = True) -> Optional[CachedImage]:
+        """
+        Descargar una fuente y actualizar la caché
+        
+        Las llamadas concurrentes para la misma fuente comparten una sola
+        descarga y una sola escritura en disco. Si la descarga supera
+        RATE_FETCH_TIMEOUT se devuelve None, pero la descarga compartida
+        continúa y actualiza la caché al terminar.
+        
+        Args:
+            source: Clave de la fuente (CRYPTO o TRMI)
+            use_shared: Aceptar una copia fresca publicada por otro proceso
+                en lugar de ir al servidor
+        
+        Returns:
+            Nueva entrada o None si la descarga falla
+        """
+        flight = self._flights.do(source, lambda: self._fetch_rate(source, use_shared))
+        try:
+            return await asyncio.wait_for(asyncio.shield(flight), RATE_FETCH_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"Tiempo agotado descargando {source} ({RATE_FETCH_TIMEOUT}s)")
+            return None
+    
+    async def _fetch_rate(self, source: str, use_shared: bool = True) -> Optional[CachedImage]:
+        """Descargar una fuente en streaming, guardarla y cachearla"""
+        url, filename = SOURCES[source]
+        
+        # Si otro proceso descargó la fuente hace poco, usar su copia
+        shared = await self._read_shared(source) if use_shared else None
+        if shared:
+            return shared
+        
+        # Con una imagen previa basta una petición condicional; la descarga
+        # escribe en disco y calcula el hash mientras llegan los bloques
+        current = self.cache.get(source)
+        if current:
+            result, not_modified = await self.image_service.download_if_modified(url, filename)
+            if not_modified:
+                self.cache.touch(source)
+                logger.info(f"Sin cambios en {filename} (petición condicional)")
+                await self._publish_shared(source, current, changed=False)
+                return current
+        else:
+            result = await self.image_service.download(url, filename)
+        
+        if result is None:
+            return None
+        
+        entry = CachedImage(data=result.data, hash=result.hash, path=result.path)
+        self.cache.set(source, entry)
+        self._schedule_photo(source, entry)
+        logger.info(f"Imagen descargada: {filename}")
+        await self._publish_shared(source, entry, changed=True)
+        return entry
+    
+    async def _read_shared(self, source: str) -> Optional[CachedImage]:
+        """Tomar la imagen publicada en el estado compartido si todavía está fresca"""
+        if not self.state:
+            return None
+        
+        try:
+            raw_meta = await self.state.get(f"rate:{source}:meta")
+            if not raw_meta:
+                return None
+            meta = json.loads(raw_meta)
+            age = time.time() - meta['fetched_at']
+            if age >= self.cache.ttl:
+                return None
+            
+            current = self.cache.get(source)
+            if current and current.hash == meta['hash']:
+                image_data, image_path = current.data, current.path
+            else:
+                image_data = await self.state.get(f"rate:{source}:image")
+                # La imagen y sus metadatos se escriben por separado
+                if not image_data or self.image_service.get_data_hash(image_data) != meta['hash']:
+                    return None
+                image_path = await self.image_service.write_image_atomic(image_data, SOURCES[source][1])
+        except Exception as e:
+            logger.error(f"Error leyendo {source} del estado compartido: {e}")
+            return None
+        
+        entry = CachedImage(
+            data=image_data,
+            hash=meta['hash'],
+            path=image_path,
+            fetched_at=time.monotonic() - max(0.0, age),
+            updated_at=datetime.fromisoformat(meta['updated_at'])
+        )
+        self.cache.set(source, entry)
+        self._schedule_photo(source, entry)
+        return entry
+    
+    async def _publish_shared(self, source: str, entry: CachedImage, changed: bool):
+        """Publicar una descarga para que los demás procesos no repitan la petición"""
+        if not self.state:
+            return
+        
+        meta = {
+            'hash': entry.hash,
+            'fetched_at': time.time() - entry.age,
+            'updated_at': entry.updated_at.isoformat(),
+        }
+        try:
+            if changed:
+                await self.state.set(f"rate:{source}:image", entry.data)
+            await self.state.set(f"rate:{source}:meta", json.dumps(meta).encode())
+        except Exception as e:
+            logger.error(f"Error publicando {source} en el estado compartido: {e}")
+    
+    async def _load_shared_progress(self):
+        """Recuperar los últimos hashes y referencias visuales del líder anterior"""
+        if not self.state:
+            return
+        
+        for source in SOURCES:
+            try:
+                last_hash = await self.state.get(f"rate:{source}:last_hash")
+                baseline = None
+                if source not in self._baseline_seeded:
+                    baseline = await self.state.get(f"rate:{source}:baseline")
+            except Exception as e:
+                logger.error(f"Error leyendo el progreso de {source}: {e}")
+                continue
+            
+            if last_hash:
+                if source == CRYPTO:
+                    self.last_crypto_hash = last_hash.decode()
+                else:
+                    self.last_trmi_hash = last_hash.decode()
+            if baseline:
+                self._baseline_seeded.add(source)
+            if baseline and CHANGE_DETECTION == 'visual':
+                signature, _ = await self.image_service.compare_visual(None, baseline)
+                if signature is not None:
+                    self._notified_signature[source] = signature
+    
+    async def _save_shared_progress(self, source: str, last_hash: str, baseline: Optional[bytes] = None):
+        """Guardar el último hash visto (y la imagen de referencia) para un futuro líder"""
+        if not self.state:
+            return
+        
+        try:
+            await self.state.set(f"rate:{source}:last_hash", last_hash.encode())
+            if baseline is not None:
+                await self.state.set(f"rate:{source}:baseline", baseline)
+        except Exception as e:
+            logger.error(f"Error guardando el progreso de {source}: {e}")
+    
+    def _schedule_refresh(self, source: str):
+        """Refrescar una fuente en segundo plano si no hay otro refresco en curso"""
+        if self._flights.in_flight(source):
+            return
+        self._spawn(self.refresh_rate(source))
+    
+    def _spawn(self, coro: Awaitable):
+        """Lanzar una tarea en segundo plano conservando su referencia"""
+        task = asyncio.create_task(coro)
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+    
+    async def close(self):
+        """Cancelar las tareas en segundo plano y esperar a que terminen"""
+        tasks = list(self._refresh_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Las descargas y variantes compartidas corren en sus propias tareas
+        await self._flights.close()
+    
+    def _schedule_extraction(self, source: str, entry: CachedImage):
+        """Extraer los valores numéricos de una imagen sin bloquear al llamador"""
+        if not self.extractor.enabled:
+            return
+        self._spawn(self.extractor.extract(source, entry))
+    
+    def _schedule_history(self, source: str, entry: CachedImage):
+        """Registrar un cambio en el historial (con sus valores extraídos) en segundo plano"""
+        self._spawn(self._record_history(source, entry))
+    
+    async def _record_history(self, source: str, entry: CachedImage):
+        extracted = await self.extractor.extract(source, entry)
+        await self.history.record(source, entry, extracted.values if extracted else {})
+    
+    def _schedule_photo(self, source: str, entry: CachedImage):
+        """Preparar en segundo plano el JPEG de una imagen nueva (una vez por imagen)"""
+        if not IMAGE_VARIANTS:
+            return
+        photo = self._photos.get(source)
+        key = ('photo', entry.hash)
+        if (photo and photo[0] == entry.hash) or self._flights.in_flight(key):
+            return
+        self._spawn(self._flights.do(key, lambda: self._build_photo(source, entry)))
+    
+    async def _build_photo(self, source: str, entry: CachedImage) -> Optional[DownloadResult]:
+        photo = await self.image_service.build_photo(entry.data, SOURCES[source][1])
+        current = self.cache.get(source)
+        # Una imagen más nueva pudo llegar mientras se generaba
+        if photo is None or (current and current.hash != entry.hash):
+            return photo
+        self._photos[source] = (entry.hash, photo)
+        
+        # Con ambas fuentes disponibles, dejar lista la tarjeta de /tasas
+        crypto, trmi = self.cache.get(CRYPTO), self.cache.get(TRMI)
+        if crypto and trmi:
+            await self.get_rates_card(crypto, trmi)
+        return photo
+    
+    def _variant_entry(self, variant: DownloadResult, original: CachedImage) -> CachedImage:
+        """Variante como entrada de caché con la antigüedad de su original"""
+        return CachedImage(
+            data=variant.data,
+            hash=variant.hash,
+            path=variant.path,
+            fetched_at=original.fetched_at,
+            updated_at=original.updated_at
         )
-        trmi_path = await self.image_service.download_image(
-            TRMI_URL, TRMI_FILENAME
+    
+    def get_photo(self, source: str, entry: CachedImage) -> CachedImage:
+        """
+        Obtener la versión de una imagen que conviene enviar como foto
+        
+        Args:
+            source: Clave de la fuente
+            entry: Imagen original
+            
+        Returns:
+            El JPEG optimizado si ya está preparado; si no, la imagen original
+        """
+        photo = self._photos.get(source)
+        if photo and photo[0] == entry.hash:
+            return self._variant_entry(photo[1], entry)
+        return entry
+    
+    async def get_rates_card(self, crypto: CachedImage, trmi: CachedImage) -> Optional[CachedImage]:
+        """
+        Obtener la tarjeta con ambas tasas para enviarlas en una sola foto
+        
+        Se genera una vez por cada par de imágenes (normalmente al detectar
+        el cambio, antes de que nadie la pida) y se reutiliza hasta el
+        siguiente cambio.
+        
+        Args:
+            crypto: Imagen de crypto
+            trmi: Imagen de TRMI
+            
+        Returns:
+            Tarjeta o None si las variantes están desactivadas o no se pudo generar
+        """
+        if not IMAGE_VARIANTS:
+            return None
+        card = self.cached_rates_card(crypto, trmi)
+        if card:
+            return card
+        key = ('card', crypto.hash, trmi.hash)
+        return await self._flights.do(key, lambda: self._build_card(crypto, trmi))
+    
+    def cached_rates_card(self, crypto: CachedImage, trmi: CachedImage) -> Optional[CachedImage]:
+        """Tarjeta ya generada para este par de imágenes, sin generarla si falta"""
+        if self._card and self._card[0] == (crypto.hash, trmi.hash):
+            return self._card[1]
+        return None
+    
+    async def _build_card(self, crypto: CachedImage, trmi: CachedImage) -> Optional[CachedImage]:
+        result = await self.image_service.build_card([crypto.data, trmi.data], RATES_CARD_FILENAME)
+        if result is None:
+            return None
+        
+        card = CachedImage(
+            data=result.data,
+            hash=result.hash,
+            path=result.path,
+            updated_at=max(crypto.updated_at, trmi.updated_at)
         )
+        self._card = ((crypto.hash, trmi.hash), card)
+        logger.info(f"Tarjeta de tasas generada ({len(result.data) / 1024:.0f} KB)")
+        return card
+    
+    def get_rate_values(self, currency: str) -> Dict[str, float]:
+        """
+        Obtener el valor extraído de una moneda en cada fuente
+        
+        Args:
+            currency: Código de la moneda (USD, EUR, MLC...)
+            
+        Returns:
+            Diccionario fuente -> valor (vacío si no hay datos)
+        """
+        values = {}
+        for source in SOURCES:
+            extracted = self.extractor.get(source)
+            if extracted and currency in extracted.values:
+                values[source] = extracted.values[currency]
+        return values
+    
+    async def get_both_rates(self) -> Tuple[Optional[CachedImage], Optional[CachedImage]]:
+        """
+        Obtener ambas tasas de cambio en paralelo
+        
+        Returns:
+            Tuple con las imágenes (crypto, trmi); un fallo en una fuente
+            no afecta a la otra
+        """
+        return await self._gather_sources(self.get_rate)
+    
+    async def _gather_sources(
+        self,
+        func: Callable[[str], Awaitable[Optional[CachedImage]]]
+    ) -> Tuple[Optional[CachedImage], Optional[CachedImage]]:
+        """Ejecutar func para ambas fuentes en paralelo aislando sus errores"""
+        results = await asyncio.gather(func(CRYPTO), func(TRMI), return_exceptions=True)
         
-        return str(crypto_path) if crypto_path else None, str(trmi_path) if trmi_path else None
+        images = []
+        for source, result in zip((CRYPTO, TRMI), results):
+            if isinstance(result, Exception):
+                logger.error(f"Error obteniendo {source}: {result}")
+                result = None
+            images.append(result)
+        return images[0], images[1]
     
-    async def get_crypto_rate(self) -> Optional[str]:
+    async def get_crypto_rate(self) -> Optional[CachedImage]:
         """
         Obtener solo la tasa de criptomonedas
         
         Returns:
-            Ruta de la imagen de crypto o None
+            Imagen de crypto o None
         """
-        result = await self.image_service.download_image(
-            CRYPTO_URL, CRYPTO_FILENAME
-        )
-        return str(result) if result else None
+        return await self.get_rate(CRYPTO)
     
-    async def get_trmi_rate(self) -> Optional[str]:
+    async def get_trmi_rate(self) -> Optional[CachedImage]:
         """
         Obtener solo la tasa del mercado informal
         
         Returns:
-            Ruta de la imagen de TRMI o None
+            Imagen de TRMI o None
         """
-        result = await self.image_service.download_image(
-            TRMI_URL, TRMI_FILENAME
-        )
-        return str(result) if result else None
+        return await self.get_rate(TRMI)
     
     async def check_for_updates(self) -> bool:
         """
@@ -68,45 +493,65 @@ class RatesService:
             True si se encontraron actualizaciones
         """
         try:
-            # Descargar imágenes actuales
-            crypto_path = await self.image_service.download_image(
-                CRYPTO_URL, CRYPTO_TEMP_FILENAME
-            )
-            trmi_path = await self.image_service.download_image(
-                TRMI_URL, TRMI_TEMP_FILENAME
+            # Continuar donde lo dejó el líder anterior, si lo hubo
+            await self._load_shared_progress()
+            
+            # Descargar imágenes actuales en paralelo (compartiendo descargas en curso)
+            crypto, trmi = await self._gather_sources(
+                lambda source: self.refresh_rate(source, use_shared=False)
             )
+            self.last_check_failed = crypto is None and trmi is None
             
             updates_found = False
             
+            # Extraer valores en segundo plano (solo si la imagen cambió)
+            for source, entry in ((CRYPTO, crypto), (TRMI, trmi)):
+                if entry:
+                    self._schedule_extraction(source, entry)
+            
             # Verificar cambios en crypto
-            if crypto_path:
-                new_hash = self.image_service.get_image_hash(crypto_path)
-                if self.last_crypto_hash and new_hash != self.last_crypto_hash:
+            if crypto:
+                if (
+                    self.last_crypto_hash and crypto.hash != self.last_crypto_hash
+                    and await self._is_significant_change(CRYPTO, crypto)
+                ):
                     await self.send_update_notification(
-                        str(crypto_path), CRYPTO_UPDATE_MESSAGE
+                        crypto, CRYPTO_UPDATE_MESSAGE
                     )
+                    self._schedule_history(CRYPTO, crypto)
                     updates_found = True
-                self.last_crypto_hash = new_hash
-                
-                # Mover archivo temporal al definitivo
-                self.image_service.move_temp_to_final(
-                    crypto_path, CRYPTO_FILENAME
-                )
+                    baseline = crypto.data
+                elif CRYPTO not in self._baseline_seeded:
+                    await self._set_visual_baseline(CRYPTO, crypto)
+                    self._schedule_history(CRYPTO, crypto)
+                    baseline = crypto.data
+                else:
+                    baseline = None
+                self.last_crypto_hash = crypto.hash
+                self._baseline_seeded.add(CRYPTO)
+                await self._save_shared_progress(CRYPTO, crypto.hash, baseline)
             
             # Verificar cambios en TRMI
-            if trmi_path:
-                new_hash = self.image_service.get_image_hash(trmi_path)
-                if self.last_trmi_hash and new_hash != self.last_trmi_hash:
+            if trmi:
+                if (
+                    self.last_trmi_hash and trmi.hash != self.last_trmi_hash
+                    and await self._is_significant_change(TRMI, trmi)
+                ):
                     await self.send_update_notification(
-                        str(trmi_path), TRMI_UPDATE_MESSAGE
+                        trmi, TRMI_UPDATE_MESSAGE
                     )
+                    self._schedule_history(TRMI, trmi)
                     updates_found = True
-                self.last_trmi_hash = new_hash
-                
-                # Mover archivo temporal al definitivo
-                self.image_service.move_temp_to_final(
-                    trmi_path, TRMI_FILENAME
-                )
+                    baseline = trmi.data
+                elif TRMI not in self._baseline_seeded:
+                    await self._set_visual_baseline(TRMI, trmi)
+                    self._schedule_history(TRMI, trmi)
+                    baseline = trmi.data
+                else:
+                    baseline = None
+                self.last_trmi_hash = trmi.hash
+                self._baseline_seeded.add(TRMI)
+                await self._save_shared_progress(TRMI, trmi.hash, baseline)
             
             if updates_found:
                 logger.info("Actualizaciones detectadas y enviadas")
@@ -117,46 +562,107 @@ class RatesService:
         
         except Exception as e:
             logger.error(f"Error verificando actualizaciones: {e}")
+            self.last_check_failed = True
             return False
     
-    async def send_update_notification(self, image_path: str, caption: str):
+    async def _is_significant_change(self, source: str, entry: CachedImage) -> bool:
         """
-        Enviar notificación de actualización a múltiples destinos
+        Decidir si una imagen con bytes distintos cambió visualmente
+        
+        Compara con la última imagen notificada, así los cambios pequeños
+        no se acumulan sin notificarse.
         
         Args:
-            image_path: Ruta de la imagen
+            source: Clave de la fuente
+            entry: Nueva imagen (ya se sabe que su MD5 cambió)
+            
+        Returns:
+            True si difieren más de CHANGE_MIN_PIXELS píxeles (o si no se puede comparar)
+        """
+        if CHANGE_DETECTION != 'visual':
+            return True
+        
+        signature, distance = await self.image_service.compare_visual(
+            self._notified_signature.get(source), entry.data
+        )
+        if distance is not None and distance <= CHANGE_MIN_PIXELS:
+            logger.info(f"Cambio no significativo en {source} ({distance} píxeles)")
+            return False
+        
+        if signature is not None:
+            self._notified_signature[source] = signature
+        return True
+    
+    async def _set_visual_baseline(self, source: str, entry: CachedImage):
+        """Guardar la firma visual de referencia de una fuente"""
+        self._baseline_seeded.add(source)
+        if CHANGE_DETECTION != 'visual':
+            return
+        signature, _ = await self.image_service.compare_visual(None, entry.data)
+        if signature is not None:
+            self._notified_signature[source] = signature
+    
+    async def send_update_notification(self, image: CachedImage, caption: str):
+        """
+        Enviar notificación de actualización a todos los suscriptores
+        
+        Args:
+            image: Imagen a enviar
             caption: Mensaje de la notificación
         """
         if not self.bot_app:
             return
-            
-        destinations = []
-        if GROUP_ID:
-            destinations.append(('grupo', GROUP_ID))
-        if CHANNEL_ID:
-            destinations.append(('canal', CHANNEL_ID))
-        if CHAT_ID:
-            destinations.append(('chat', CHAT_ID))
         
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
-        for dest_type, dest_id in destinations:
-            try:
-                await self.bot_app.bot.send_photo(
-                    chat_id=dest_id,
-                    photo=open(image_path, 'rb'),
-                    caption=f"{caption}\n\n🕐 {timestamp}"
-                )
-                logger.info(f"Notificación enviada al {dest_type} {dest_id}")
-            except Exception as e:
-                logger.error(f"Error enviando notificación al {dest_type} {dest_id}: {e}")
+        # Suscripciones y file_id que atendieron otras réplicas
+        await self.subscribers.refresh()
+        await self.file_ids.refresh()
+        
+        result = await self.notifier.broadcast(
+            self.bot_app.bot,
+            self.subscribers.all(),
+            image,
+            f"{caption}\n\n🕐 {timestamp}"
+        )
+        
+        # Dar de baja los chats que bloquearon o expulsaron al bot
+        for chat_id in result.unreachable:
+            self.subscribers.remove(chat_id)
     
-    def initialize_hashes(self):
-        """Inicializar hashes con las imágenes existentes"""
-        crypto_path = self.image_service.get_image_path(CRYPTO_FILENAME)
-        trmi_path = self.image_service.get_image_path(TRMI_FILENAME)
+    async def _read_stored(self, source: str) -> Optional[CachedImage]:
+        """Última imagen guardada en disco de una fuente (sin cachearla)"""
+        filename = SOURCES[source][1]
+        stored = await self.image_service.read_image(filename)
+        if not stored:
+            return None
         
-        if crypto_path.exists():
-            self.last_crypto_hash = self.image_service.get_image_hash(crypto_path)
-        if trmi_path.exists():
-            self.last_trmi_hash = self.image_service.get_image_hash(trmi_path) 
\ No newline at end of file
+        # La antigüedad de la entrada es la del archivo en disco
+        image_data, modified = stored
+        return CachedImage(
+            data=image_data,
+            hash=self.image_service.get_data_hash(image_data),
+            path=self.image_service.get_image_path(filename),
+            fetched_at=time.monotonic() - max(0.0, time.time() - modified),
+            updated_at=datetime.fromtimestamp(modified)
+        )
+    
+    async def initialize_hashes(self):
+        """Inicializar hashes y caché con las imágenes existentes"""
+        for source in SOURCES:
+            # Un comando pudo descargar una imagen más nueva durante el arranque
+            if self.cache.get(source):
+                continue
+            entry = await self._read_stored(source)
+            if not entry:
+                continue
+            self.cache.set(source, entry)
+            
+            self._schedule_photo(source, entry)
+            self._schedule_extraction(source, entry)
+            self._spawn(self._set_visual_baseline(source, entry))
+            
+            if source == CRYPTO:
+                self.last_crypto_hash = entry.hash
+            else:
+                self.last_trmi_hash = entry.hash
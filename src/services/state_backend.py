@@ -0,0 +1,332 @@
+"""
+Estado compartido entre procesos del bot: imágenes, hashes y elección de líder
+"""
+import abc
+import asyncio
+import fcntl
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional, TypeVar
+from src.config.settings import STATE_BACKEND, STATE_DIR, REDIS_URL, STATE_KEY_PREFIX
+from src.utils.logger import logger
+
+T = TypeVar('T')
+
+# Renovar el lease solo si sigue siendo nuestro; si no, tomarlo si está libre
+_ACQUIRE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+if redis.call('set', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 1
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class StateBackend(abc.ABC):
+    """
+    Almacén clave-valor compartido con locks con vencimiento
+    
+    Las claves son texto y los valores bytes. Además de valores simples hay
+    hashes (campo -> texto) cuyos campos se modifican de forma atómica sin
+    reescribir los de otros procesos. Los locks son leases: quien los tiene
+    debe renovarlos antes de `ttl` o los pierde.
+    """
+    
+    async def start(self):
+        """Preparar el backend"""
+    
+    async def close(self):
+        """Liberar los recursos del backend"""
+    
+    @abc.abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        """Leer un valor (None si no existe)"""
+    
+    @abc.abstractmethod
+    async def set(self, key: str, value: bytes):
+        """Guardar un valor"""
+    
+    @abc.abstractmethod
+    async def get_fields(self, key: str) -> Dict[str, str]:
+        """Leer todos los campos de un hash (vacío si no existe)"""
+    
+    @abc.abstractmethod
+    async def set_fields(self, key: str, fields: Dict[str, Optional[str]]):
+        """
+        Modificar campos de un hash en una sola operación
+        
+        Args:
+            key: Clave del hash
+            fields: Campo -> valor nuevo (None = borrar el campo)
+        """
+    
+    @abc.abstractmethod
+    async def acquire_lock(self, name: str, owner: str, ttl: float) -> bool:
+        """
+        Tomar o renovar un lock
+        
+        Args:
+            name: Nombre del lock
+            owner: Identificador único de quien lo pide
+            ttl: Segundos que dura el lease
+        
+        Returns:
+            True si `owner` tiene el lock al terminar
+        """
+    
+    @abc.abstractmethod
+    async def release_lock(self, name: str, owner: str):
+        """Soltar un lock si pertenece a `owner`"""
+
+
+class LocalStateBackend(StateBackend):
+    """
+    Estado en archivos de un directorio
+    
+    Sirve para un proceso o para varios procesos en la misma máquina: los
+    valores se reemplazan de forma atómica y los locks se deciden bajo un
+    flock, todo en un hilo dedicado para no bloquear el event loop.
+    """
+    
+    def __init__(self, directory: Path = STATE_DIR):
+        self.directory = directory
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='state')
+    
+    async def _run(self, func: Callable[..., T], *args) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+    
+    def _path(self, key: str) -> Path:
+        return self.directory / key.replace('/', '_').replace(':', '__')
+    
+    async def start(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+    
+    async def close(self):
+        self._executor.shutdown(wait=True)
+    
+    def _read(self, path: Path) -> Optional[bytes]:
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            return None
+    
+    def _write(self, path: Path, value: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix='.tmp', dir=path.parent)
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                temp_file.write(value)
+            os.replace(temp_name, path)
+        except BaseException:
+            Path(temp_name).unlink(missing_ok=True)
+            raise
+    
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._run(self._read, self._path(key))
+    
+    async def set(self, key: str, value: bytes):
+        await self._run(self._write, self._path(key), value)
+    
+    @contextmanager
+    def _locked(self, path: Path) -> Iterator[None]:
+        """Excluir a los demás procesos que modifican `path` (bloqueante)"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path.with_suffix('.flock'), 'a') as guard:
+            fcntl.flock(guard, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(guard, fcntl.LOCK_UN)
+    
+    def _read_fields(self, path: Path) -> Dict[str, str]:
+        raw = self._read(path)
+        return json.loads(raw) if raw else {}
+    
+    def _update_fields(self, path: Path, fields: Dict[str, Optional[str]]):
+        """Leer, modificar y reescribir un hash bajo flock"""
+        with self._locked(path):
+            current = self._read_fields(path)
+            for field, value in fields.items():
+                if value is None:
+                    current.pop(field, None)
+                else:
+                    current[field] = value
+            self._write(path, json.dumps(current).encode())
+    
+    async def get_fields(self, key: str) -> Dict[str, str]:
+        # Las escrituras reemplazan el archivo entero: leer no necesita el flock
+        return await self._run(self._read_fields, self._path(f"hash:{key}"))
+    
+    async def set_fields(self, key: str, fields: Dict[str, Optional[str]]):
+        await self._run(self._update_fields, self._path(f"hash:{key}"), fields)
+    
+    def _update_lease(self, name: str, owner: str, ttl: Optional[float]) -> bool:
+        """Leer y reescribir el lease bajo flock (ttl None = soltar)"""
+        path = self._path(f"lock:{name}")
+        with self._locked(path):
+            raw = self._read(path)
+            lease = json.loads(raw) if raw else {}
+            now = time.time()
+            held_by_other = lease.get('owner') != owner and lease.get('expires', 0) > now
+            if ttl is None:
+                if lease.get('owner') == owner:
+                    path.unlink(missing_ok=True)
+                return False
+            if held_by_other:
+                return False
+            self._write(path, json.dumps({'owner': owner, 'expires': now + ttl}).encode())
+            return True
+    
+    async def acquire_lock(self, name: str, owner: str, ttl: float) -> bool:
+        return await self._run(self._update_lease, name, owner, ttl)
+    
+    async def release_lock(self, name: str, owner: str):
+        await self._run(self._update_lease, name, owner, None)
+
+
+class RedisStateBackend(StateBackend):
+    """
+    Estado en un servidor compatible con Redis (Redis, Valkey, KeyDB...)
+    
+    Permite repartir el bot entre varias máquinas. Requiere el paquete
+    opcional `redis`; se puede pasar un cliente ya creado (por ejemplo uno
+    apuntando a un servidor local de pruebas).
+    """
+    
+    def __init__(self, url: str = REDIS_URL, prefix: str = STATE_KEY_PREFIX, client=None):
+        self.url = url
+        self.prefix = prefix
+        self._client = client
+    
+    async def start(self):
+        if self._client is None:
+            import redis.asyncio as redis
+            self._client = redis.from_url(self.url)
+        await self._client.ping()
+        logger.info(f"Estado compartido en Redis: {self.url}")
+    
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._client.get(self.prefix + key)
+    
+    async def set(self, key: str, value: bytes):
+        await self._client.set(self.prefix + key, value)
+    
+    async def get_fields(self, key: str) -> Dict[str, str]:
+        fields = await self._client.hgetall(self.prefix + key)
+        return {field.decode(): value.decode() for field, value in fields.items()}
+    
+    async def set_fields(self, key: str, fields: Dict[str, Optional[str]]):
+        updates = {field: value for field, value in fields.items() if value is not None}
+        deletes = [field for field, value in fields.items() if value is None]
+        pipe = self._client.pipeline(transaction=True)
+        if updates:
+            pipe.hset(self.prefix + key, mapping=updates)
+        if deletes:
+            pipe.hdel(self.prefix + key, *deletes)
+        await pipe.execute()
+    
+    async def acquire_lock(self, name: str, owner: str, ttl: float) -> bool:
+        result = await self._client.eval(
+            _ACQUIRE_SCRIPT, 1, f"{self.prefix}lock:{name}", owner, int(ttl * 1000)
+        )
+        return bool(result)
+    
+    async def release_lock(self, name: str, owner: str):
+        await self._client.eval(_RELEASE_SCRIPT, 1, f"{self.prefix}lock:{name}", owner)
+
+
+class SharedHash:
+    """
+    Hash del estado compartido con escrituras agrupadas en segundo plano
+    
+    `set` no espera (se puede llamar desde código síncrono): los cambios se
+    acumulan y se aplican en lote. `load` devuelve el hash compartido con los
+    cambios propios que todavía no se escribieron.
+    """
+    
+    def __init__(self, backend: StateBackend, key: str):
+        self.backend = backend
+        self.key = key
+        self._pending: Dict[str, Optional[str]] = {}
+        # Lote que se está escribiendo ahora
+        self._writing: Dict[str, Optional[str]] = {}
+        self._task: Optional[asyncio.Task] = None
+    
+    def set(self, field: str, value: Optional[str]):
+        """Encolar un cambio de campo (None = borrarlo)"""
+        self._pending[field] = value
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Sin event loop el cambio se escribe en el siguiente flush
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._write_pending())
+    
+    async def _write_pending(self):
+        # Los cambios que llegan durante una escritura se agrupan en la siguiente
+        while self._pending:
+            self._writing, self._pending = self._pending, {}
+            try:
+                await self.backend.set_fields(self.key, self._writing)
+            except Exception as e:
+                logger.error(f"Error guardando {self.key} en el estado compartido: {e}")
+                # Conservar los cambios para el siguiente intento
+                self._pending = {**self._writing, **self._pending}
+                return
+            finally:
+                self._writing = {}
+    
+    async def flush(self):
+        """Esperar a que se escriban los cambios pendientes"""
+        if self._task and not self._task.done():
+            await self._task
+        if self._pending:
+            await self._write_pending()
+    
+    async def load(self) -> Dict[str, str]:
+        """Leer el hash, incluidos los cambios propios aún sin escribir"""
+        fields = await self.backend.get_fields(self.key)
+        for field, value in {**self._writing, **self._pending}.items():
+            if value is None:
+                fields.pop(field, None)
+            else:
+                fields[field] = value
+        return fields
+
+
+def create_state_backend(kind: str = STATE_BACKEND) -> StateBackend:
+    """
+    Crear el backend configurado en STATE_BACKEND
+    
+    Args:
+        kind: 'local' o 'redis'
+    
+    Returns:
+        Backend sin iniciar
+    """
+    if kind == 'redis':
+        return RedisStateBackend()
+    if kind != 'local':
+        logger.warning(f"STATE_BACKEND desconocido '{kind}', usando 'local'")
+    return LocalStateBackend()
@@ -0,0 +1,235 @@
+"""
+Registro persistente de suscriptores a las notificaciones
+"""
+import asyncio
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from src.config.settings import (
+    SUBSCRIBERS_DB, SUBSCRIBERS_FLUSH_INTERVAL, SUBSCRIBERS_BATCH_SIZE
+)
+from src.services.state_backend import SharedHash, StateBackend
+from src.utils.logger import logger
+
+# Marca de que los suscriptores de SQLite ya se copiaron al estado compartido
+_MIGRATED_KEY = 'subscribers:migrated'
+
+
+class SubscriberStore:
+    """
+    Suscriptores guardados en SQLite (modo WAL) con una copia en memoria
+    
+    Las lecturas se sirven siempre desde memoria; las altas y bajas se
+    acumulan y se escriben por lotes en un hilo aparte.
+    
+    Con un estado compartido, las altas y bajas también se publican ahí y la
+    copia en memoria se recarga de él periódicamente y antes de cada
+    difusión, así el líder ve los /subscribe atendidos por otras réplicas.
+    SQLite queda como copia local del mismo conjunto.
+    """
+    
+    def __init__(
+        self,
+        db_path: Path = SUBSCRIBERS_DB,
+        flush_interval: float = SUBSCRIBERS_FLUSH_INTERVAL,
+        batch_size: int = SUBSCRIBERS_BATCH_SIZE,
+        state: Optional[StateBackend] = None
+    ):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.state = state
+        self._shared = SharedHash(state, 'subscribers') if state else None
+        self._subscribers: Dict[str, str] = {}
+        # chat_id -> tipo de chat (alta) o None (baja) pendientes de escribir
+        self._pending: Dict[str, Optional[str]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._batch_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+    
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+    
+    def _load(self) -> Tuple[Dict[str, str], Set[str]]:
+        """Crear el esquema y leer suscriptores y chats ya sembrados (bloqueante)"""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS subscribers ("
+                "chat_id TEXT PRIMARY KEY, "
+                "chat_type TEXT NOT NULL, "
+                "subscribed_at TEXT NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS seeded_chats (chat_id TEXT PRIMARY KEY)")
+            rows = conn.execute("SELECT chat_id, chat_type FROM subscribers").fetchall()
+            seeded = conn.execute("SELECT chat_id FROM seeded_chats").fetchall()
+        return dict(rows), {chat_id for (chat_id,) in seeded}
+    
+    def _mark_seeded(self, chat_ids: List[str]):
+        """Recordar los chats de configuración ya sembrados (bloqueante)"""
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO seeded_chats (chat_id) VALUES (?)",
+                [(chat_id,) for chat_id in chat_ids]
+            )
+    
+    def _write(self, changes: Dict[str, Optional[str]]):
+        """Aplicar un lote de altas y bajas en una sola transacción (bloqueante)"""
+        now = datetime.now().isoformat(timespec='seconds')
+        inserts = [(chat_id, chat_type, now) for chat_id, chat_type in changes.items() if chat_type]
+        deletes = [(chat_id,) for chat_id, chat_type in changes.items() if not chat_type]
+        with closing(self._connect()) as conn, conn:
+            if inserts:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO subscribers (chat_id, chat_type, subscribed_at) "
+                    "VALUES (?, ?, ?)",
+                    inserts
+                )
+            if deletes:
+                conn.executemany("DELETE FROM subscribers WHERE chat_id = ?", deletes)
+    
+    async def start(self, seed: Iterable[str] = ()):
+        """
+        Cargar los suscriptores y arrancar la escritura periódica
+        
+        Args:
+            seed: Chats configurados por variables de entorno que se
+                suscriben la primera vez que aparecen
+        """
+        self._subscribers, seeded = await asyncio.to_thread(self._load)
+        await self._migrate_to_shared()
+        
+        # Cada chat de configuración se siembra una sola vez, para que un
+        # /unsubscribe posterior no se revierta en el siguiente arranque
+        new_seeds = [str(chat_id) for chat_id in seed if chat_id and str(chat_id) not in seeded]
+        for chat_id in new_seeds:
+            self.add(chat_id, 'config')
+        if new_seeds:
+            await asyncio.to_thread(self._mark_seeded, new_seeds)
+        await self.refresh()
+        logger.info(f"Suscriptores cargados: {len(self._subscribers)}")
+        
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+    
+    async def _migrate_to_shared(self):
+        """Publicar los suscriptores de SQLite la primera vez que se usa el estado compartido"""
+        if not self._shared:
+            return
+        try:
+            if await self.state.get(_MIGRATED_KEY):
+                return
+            for chat_id, chat_type in self._subscribers.items():
+                self._shared.set(chat_id, chat_type)
+            await self._shared.flush()
+            await self.state.set(_MIGRATED_KEY, b'1')
+        except Exception as e:
+            logger.error(f"Error publicando los suscriptores en el estado compartido: {e}")
+    
+    async def refresh(self):
+        """Recargar los suscriptores del estado compartido (sin estado no hace nada)"""
+        if not self._shared:
+            return
+        try:
+            shared = await self._shared.load()
+        except Exception as e:
+            logger.error(f"Error leyendo los suscriptores compartidos: {e}")
+            return
+        
+        # Reflejar en memoria y en SQLite las altas y bajas de otras réplicas
+        for chat_id in [chat_id for chat_id in self._subscribers if chat_id not in shared]:
+            del self._subscribers[chat_id]
+            self._schedule(chat_id, None, share=False)
+        for chat_id, chat_type in shared.items():
+            if self._subscribers.get(chat_id) != chat_type:
+                self._subscribers[chat_id] = chat_type
+                self._schedule(chat_id, chat_type, share=False)
+    
+    async def close(self):
+        """Detener la escritura periódica y guardar los cambios pendientes"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        if self._shared:
+            await self._shared.flush()
+    
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            await self.refresh()
+    
+    async def flush(self):
+        """Escribir en disco las altas y bajas pendientes"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            changes, self._pending = self._pending, {}
+            try:
+                await asyncio.to_thread(self._write, changes)
+            except Exception as e:
+                logger.error(f"Error guardando suscriptores: {e}")
+                # Conservar los cambios para el siguiente intento
+                self._pending = {**changes, **self._pending}
+    
+    def _schedule(self, chat_id: str, chat_type: Optional[str], share: bool = True):
+        if share and self._shared:
+            self._shared.set(chat_id, chat_type)
+        self._pending[chat_id] = chat_type
+        if len(self._pending) >= self.batch_size and not self._flush_lock.locked():
+            self._batch_task = asyncio.create_task(self.flush())
+    
+    def add(self, chat_id, chat_type: str) -> bool:
+        """
+        Suscribir un chat
+        
+        Args:
+            chat_id: ID del chat
+            chat_type: Tipo de chat (private, group, supergroup, channel, config)
+        
+        Returns:
+            True si el chat no estaba suscrito
+        """
+        chat_id = str(chat_id)
+        if chat_id in self._subscribers:
+            return False
+        self._subscribers[chat_id] = chat_type
+        self._schedule(chat_id, chat_type)
+        return True
+    
+    def remove(self, chat_id) -> bool:
+        """
+        Cancelar la suscripción de un chat
+        
+        Args:
+            chat_id: ID del chat
+        
+        Returns:
+            True si el chat estaba suscrito
+        """
+        chat_id = str(chat_id)
+        if self._subscribers.pop(chat_id, None) is None:
+            return False
+        self._schedule(chat_id, None)
+        return True
+    
+    def is_subscribed(self, chat_id) -> bool:
+        """Verificar si un chat está suscrito"""
+        return str(chat_id) in self._subscribers
+    
+    def all(self) -> List[str]:
+        """Obtener todos los chats suscritos (desde memoria)"""
+        return list(self._subscribers)
+    
+    def __len__(self) -> int:
+        return len(self._subscribers)
@@ -0,0 +1,125 @@
+"""
+Circuit breaker y presupuesto de reintentos para las fuentes externas
+"""
+import random
+import time
+from src.config.settings import (
+    CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT, CIRCUIT_MAX_RESET_TIMEOUT,
+    RETRY_BUDGET_RATIO, RETRY_BUDGET_MIN_PER_SECOND
+)
+
+# Variación aleatoria (±) del tiempo que el circuito permanece abierto
+JITTER = 0.2
+
+
+class CircuitBreaker:
+    """
+    Corta las peticiones a una fuente que falla seguido
+    
+    Tras `failure_threshold` fallos consecutivos el circuito se abre y las
+    peticiones se rechazan al instante. Pasado `reset_timeout` (con jitter)
+    deja pasar una sola petición de prueba: si funciona se cierra; si falla
+    vuelve a abrirse el doble de tiempo, hasta `max_reset_timeout`.
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(
+        self,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_TIMEOUT,
+        max_reset_timeout: float = CIRCUIT_MAX_RESET_TIMEOUT
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max(max_reset_timeout, reset_timeout)
+        self.state = self.CLOSED
+        self.failures = 0
+        # Aperturas seguidas sin una petición exitosa (para el retroceso exponencial)
+        self._trips = 0
+        self._open_until = 0.0
+    
+    def allow_request(self) -> bool:
+        """
+        Verificar si se puede hacer una petición ahora
+        
+        Returns:
+            True con el circuito cerrado o para la única prueba tras el
+            tiempo de espera; False mientras esté abierto
+        """
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() >= self._open_until:
+            self.state = self.HALF_OPEN
+            return True
+        return False
+    
+    def record_success(self):
+        """Registrar una petición exitosa: cierra el circuito"""
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trips = 0
+    
+    def record_failure(self):
+        """Registrar un fallo: abre el circuito al llegar al umbral o si falló la prueba"""
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self._trips += 1
+            timeout = min(self.max_reset_timeout, self.reset_timeout * 2 ** (self._trips - 1))
+            self._open_until = time.monotonic() + timeout * random.uniform(1 - JITTER, 1 + JITTER)
+            self.state = self.OPEN
+    
+    @property
+    def retry_in(self) -> float:
+        """Segundos hasta la próxima petición de prueba (0 si no está abierto)"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self._open_until - time.monotonic())
+
+
+class RetryBudget:
+    """
+    Limita los reintentos a una fracción de las peticiones
+    
+    Cada petición suma `ratio` fichas y además se acumulan `min_per_second`
+    fichas por segundo (hasta `capacity`); cada reintento gasta una. Así,
+    con la fuente caída, los reintentos no multiplican la carga sobre ella.
+    """
+    
+    def __init__(
+        self,
+        ratio: float = RETRY_BUDGET_RATIO,
+        min_per_second: float = RETRY_BUDGET_MIN_PER_SECOND,
+        capacity: float = 10.0
+    ):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+    
+    def _refill(self, amount: float = 0.0):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.min_per_second + amount
+        )
+        self._updated = now
+    
+    def record_request(self):
+        """Registrar una petición original (no un reintento)"""
+        self._refill(self.ratio)
+    
+    def try_retry(self) -> bool:
+        """
+        Consumir una ficha para reintentar
+        
+        Returns:
+            True si queda presupuesto para el reintento
+        """
+        self._refill()
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
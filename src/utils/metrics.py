@@ -0,0 +1,278 @@
+"""
+Métricas en memoria con exposición en formato de texto de Prometheus
+"""
+import abc
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+# Segundos: de 5 ms a 1 minuto, cubre desde respuestas en caché hasta descargas lentas
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric(abc.ABC):
+    """Base común: nombre, ayuda y etiquetas"""
+    kind = 'untyped'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+    
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} espera las etiquetas {self.labelnames}, no {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+    
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+    
+    @abc.abstractmethod
+    def render(self) -> List[str]:
+        """Líneas de la métrica en formato de texto de Prometheus"""
+
+
+class Counter(_Metric):
+    """Valor que solo crece"""
+    kind = 'counter'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+    
+    def inc(self, amount: float = 1, **labels):
+        """Incrementar el contador"""
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+    
+    def value(self, **labels) -> float:
+        """Valor actual (con etiquetas parciales suma las series que coinciden)"""
+        return sum(
+            value for key, value in self._values.items()
+            if all(key[self.labelnames.index(name)] == str(wanted) for name, wanted in labels.items())
+        )
+    
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(_Metric):
+    """Valor que sube y baja, fijado a mano o leído de una función al exponerlo"""
+    kind = 'gauge'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+    
+    def set(self, value: float, **labels):
+        """Fijar el valor"""
+        self._values[self._key(labels)] = value
+    
+    def set_function(self, function: Callable[[], float], **labels):
+        """Leer el valor de `function` cada vez que se exponga"""
+        self._functions[self._key(labels)] = function
+    
+    def render(self) -> List[str]:
+        values = dict(self._values)
+        for key, function in self._functions.items():
+            try:
+                values[key] = function()
+            except Exception:
+                continue
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """Distribución acumulada por cubetas, con suma y cantidad de observaciones"""
+    kind = 'histogram'
+    
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # etiquetas -> (conteo por cubeta no acumulado, suma)
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+    
+    def observe(self, value: float, **labels):
+        """Registrar una observación"""
+        key = self._key(labels)
+        counts, total = self._series.setdefault(key, ([0] * len(self.buckets), [0.0]))
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+    
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Medir la duración del bloque en segundos"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+    
+    def _merged(self, labels: Dict[str, str]) -> Tuple[List[int], float]:
+        counts = [0] * len(self.buckets)
+        total = 0.0
+        for key, (series_counts, series_total) in self._series.items():
+            if all(key[self.labelnames.index(name)] == str(wanted) for name, wanted in labels.items()):
+                counts = [a + b for a, b in zip(counts, series_counts)]
+                total += series_total[0]
+        return counts, total
+    
+    def count(self, **labels) -> int:
+        """Cantidad de observaciones (con etiquetas parciales suma las series)"""
+        return sum(self._merged(labels)[0])
+    
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """
+        Estimar un cuantil interpolando dentro de la cubeta que lo contiene
+        
+        Args:
+            q: Cuantil entre 0 y 1
+            labels: Etiquetas (parciales) de las series a combinar
+        
+        Returns:
+            Valor estimado o None si no hay observaciones
+        """
+        counts, _ = self._merged(labels)
+        observed = sum(counts)
+        if not observed:
+            return None
+        
+        rank = q * observed
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index]
+                if upper == float('inf'):
+                    return lower
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-2]
+    
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Conjunto de métricas del proceso"""
+    
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+    
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+    
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Obtener o crear un contador"""
+        return self._register(Counter(name, documentation, labelnames))
+    
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        """Obtener o crear un gauge"""
+        return self._register(Gauge(name, documentation, labelnames))
+    
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        """Obtener o crear un histograma"""
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+    
+    def render(self) -> str:
+        """Todas las métricas en formato de texto de Prometheus"""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Registro global del bot
+registry = MetricsRegistry()
+
+DOWNLOAD_SECONDS = registry.histogram(
+    'cambiobot_download_seconds', 'Duración de las descargas de imágenes', ['url', 'result']
+)
+DOWNLOAD_BYTES = registry.counter(
+    'cambiobot_download_bytes_total', 'Bytes descargados de las fuentes', ['url']
+)
+CACHE_REQUESTS = registry.counter(
+    'cambiobot_cache_requests_total', 'Lecturas de la caché de imágenes', ['source', 'result']
+)
+COMMAND_SECONDS = registry.histogram(
+    'cambiobot_command_seconds', 'Duración de los comandos', ['command']
+)
+NOTIFICATION_SECONDS = registry.histogram(
+    'cambiobot_notification_seconds', 'Duración de cada envío de notificación'
+)
+NOTIFICATIONS = registry.counter(
+    'cambiobot_notifications_total', 'Notificaciones por resultado', ['result']
+)
+JOB_SECONDS = registry.histogram(
+    'cambiobot_job_seconds', 'Duración de los jobs programados', ['job']
+)
+UPDATES = registry.gauge(
+    'cambiobot_updates', 'Updates dentro del procesador', ['state']
+)
+SUBSCRIBERS = registry.gauge(
+    'cambiobot_subscribers', 'Chats suscritos'
+)
+POLL_INTERVAL = registry.gauge(
+    'cambiobot_poll_interval_seconds', 'Intervalo elegido para la próxima verificación'
+)
+STARTUP_SECONDS = registry.gauge(
+    'cambiobot_startup_seconds', 'Duración del arranque por fase', ['phase']
+)
+DOWNLOAD_RETRIES = registry.counter(
+    'cambiobot_download_retries_total', 'Reintentos de descarga y peticiones cortadas', ['url', 'result']
+)
+CIRCUIT_OPEN = registry.gauge(
+    'cambiobot_circuit_open', 'Circuito de la fuente abierto (1) o cerrado (0)', ['url']
+)
@@ -0,0 +1,67 @@
+"""
+Limitadores de tasa tipo token bucket para asyncio
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+
+class TokenBucket:
+    """Token bucket asíncrono: `rate` tokens por segundo con ráfagas de `capacity`"""
+    
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    async def acquire(self):
+        """Esperar hasta que haya un token disponible y consumirlo"""
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+    
+    def pause(self, seconds: float):
+        """Vaciar el bucket para no emitir durante `seconds` segundos (flood control)"""
+        self._tokens = min(self._tokens, -seconds * self.rate)
+        self._updated = time.monotonic()
+
+
+class KeyedTokenBuckets:
+    """Un TokenBucket por clave (por ejemplo, por chat), con límite de claves en memoria"""
+    
+    def __init__(self, rate: float, capacity: float = 1.0, max_keys: int = 10000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+    
+    def get(self, key: Hashable) -> TokenBucket:
+        """
+        Obtener el bucket de una clave, creándolo si no existe
+        
+        Args:
+            key: Clave del bucket
+        
+        Returns:
+            TokenBucket asociado a la clave
+        """
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.capacity)
+            self._buckets[key] = bucket
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
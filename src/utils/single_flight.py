@@ -0,0 +1,53 @@
+"""
+Coalescencia de operaciones asíncronas concurrentes (single-flight)
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """Agrupa llamadas concurrentes con la misma clave en una sola ejecución"""
+    
+    def __init__(self):
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+    
+    def in_flight(self, key: Hashable) -> bool:
+        """Verificar si hay una ejecución en curso para la clave"""
+        return key in self._flights
+    
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Ejecutar func una sola vez por clave mientras esté en curso
+        
+        Los llamadores que llegan mientras la ejecución está en curso
+        esperan y reciben el mismo resultado (o la misma excepción). La
+        ejecución corre en su propia tarea: cancelar a cualquier llamador,
+        incluido el que la inició, no la cancela para los demás.
+        
+        Args:
+            key: Clave que identifica la operación
+            func: Función asíncrona a ejecutar
+        
+        Returns:
+            Resultado de la ejecución compartida
+        """
+        future = self._flights.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self._flights[key] = future
+            future.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(future)
+    
+    async def close(self):
+        """Cancelar las ejecuciones en curso y esperar a que terminen"""
+        flights = list(self._flights.values())
+        for future in flights:
+            future.cancel()
+        await asyncio.gather(*flights, return_exceptions=True)
+    
+    def _finish(self, key: Hashable, future: asyncio.Future):
+        if self._flights.get(key) is future:
+            del self._flights[key]
+        # Evitar avisos de "exception was never retrieved" si nadie quedó esperando
+        if not future.cancelled():
+            future.exception()